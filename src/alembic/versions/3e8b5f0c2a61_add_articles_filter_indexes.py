@@ -0,0 +1,30 @@
+"""add articles filter indexes
+
+Revision ID: 3e8b5f0c2a61
+Revises: 9a4c2e71d3b8
+Create Date: 2026-10-18 11:05:12.402377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8b5f0c2a61'
+down_revision = '9a4c2e71d3b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Порядок колонок повторяет запросы get_articles: фильтры на равенство, затем сортировка по id
+    op.create_index('ix_articles_author_id_id', 'articles', ['author_id', 'id'], unique=False)
+    op.create_index('ix_articles_published_date_id', 'articles', ['published_date', 'id'], unique=False)
+    op.create_index('ix_articles_author_id_published_date_id', 'articles',
+                    ['author_id', 'published_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_articles_author_id_published_date_id', table_name='articles')
+    op.drop_index('ix_articles_published_date_id', table_name='articles')
+    op.drop_index('ix_articles_author_id_id', table_name='articles')
@@ -0,0 +1,100 @@
+"""add article counts
+
+Revision ID: 6d2f41a8c953
+Revises: b4d17a6c9e30
+Create Date: 2026-10-18 17:05:12.402716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2f41a8c953'
+down_revision = 'b4d17a6c9e30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'article_counts',
+        sa.Column('author_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('articles', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.PrimaryKeyConstraint('author_id'),
+    )
+    # Общее число статей - сумма 16 строк author_id от -16 до -1 (COUNT_SLOTS): каждое
+    # соединение пишет в свою строку (по pg_backend_pid), чтобы параллельные записи
+    # не ждали блокировки одной строки до COMMIT; значение отдельной строки может
+    # быть отрицательным. 0 - статьи без автора. Вставка и удаление учитываются
+    # один раз на оператор (пачка статей - одно обновление счетчика на автора);
+    # строки блокируются по порядку author_id (общая первой), чтобы параллельные
+    # пачки не взаимоблокировались. Строки авторов, где счетчик дошел до нуля,
+    # удаляются, поэтому таблица не растет за счет авторов без статей.
+    op.execute("""
+        CREATE FUNCTION articles_count() RETURNS trigger AS $$
+        DECLARE
+            slot integer := -1 - pg_backend_pid() % 16;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO article_counts AS counts (author_id, articles)
+                SELECT slot, count(*) FROM new_rows
+                UNION ALL
+                SELECT coalesce(author_id, 0), count(*) FROM new_rows GROUP BY 1
+                ORDER BY 1
+                ON CONFLICT (author_id) DO UPDATE SET articles = counts.articles + EXCLUDED.articles;
+            ELSE
+                INSERT INTO article_counts AS counts (author_id, articles)
+                SELECT slot, -count(*) FROM old_rows
+                ON CONFLICT (author_id) DO UPDATE SET articles = counts.articles + EXCLUDED.articles;
+                UPDATE article_counts AS counts SET articles = counts.articles - deleted.articles
+                FROM (SELECT coalesce(author_id, 0) AS author_id, count(*) AS articles
+                      FROM old_rows GROUP BY 1 ORDER BY 1) AS deleted
+                WHERE counts.author_id = deleted.author_id;
+                DELETE FROM article_counts
+                WHERE articles = 0 AND author_id IN (SELECT coalesce(author_id, 0) FROM old_rows);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER articles_count_insert AFTER INSERT ON articles
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION articles_count();
+    """)
+    op.execute("""
+        CREATE TRIGGER articles_count_delete AFTER DELETE ON articles
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION articles_count();
+    """)
+    # Смена автора редкая, поэтому отдельный построчный триггер только на нее
+    op.execute("""
+        CREATE FUNCTION articles_count_author() RETURNS trigger AS $$
+        BEGIN
+            UPDATE article_counts SET articles = articles - 1 WHERE author_id = coalesce(OLD.author_id, 0);
+            DELETE FROM article_counts WHERE author_id = coalesce(OLD.author_id, 0) AND articles = 0;
+            INSERT INTO article_counts AS counts (author_id, articles) VALUES (coalesce(NEW.author_id, 0), 1)
+            ON CONFLICT (author_id) DO UPDATE SET articles = counts.articles + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER articles_count_author AFTER UPDATE OF author_id ON articles
+        FOR EACH ROW WHEN (OLD.author_id IS DISTINCT FROM NEW.author_id)
+        EXECUTE FUNCTION articles_count_author();
+    """)
+    op.execute("""
+        INSERT INTO article_counts (author_id, articles)
+        SELECT -1, count(*) FROM articles
+        UNION ALL
+        SELECT coalesce(author_id, 0), count(*) FROM articles GROUP BY 1;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER articles_count_author ON articles;")
+    op.execute("DROP FUNCTION articles_count_author();")
+    op.execute("DROP TRIGGER articles_count_delete ON articles;")
+    op.execute("DROP TRIGGER articles_count_insert ON articles;")
+    op.execute("DROP FUNCTION articles_count();")
+    op.drop_table('article_counts')
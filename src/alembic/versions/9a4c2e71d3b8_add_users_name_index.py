@@ -0,0 +1,24 @@
+"""add users name index
+
+Revision ID: 9a4c2e71d3b8
+Revises: 5dbd008b9d76
+Create Date: 2026-10-18 10:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c2e71d3b8'
+down_revision = '5dbd008b9d76'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_users_name'), 'users', ['name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_name'), table_name='users')
@@ -0,0 +1,49 @@
+"""add articles search vector
+
+Revision ID: b4d17a6c9e30
+Revises: c71f0d94e2a5
+Create Date: 2026-10-18 15:20:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d17a6c9e30'
+down_revision = 'c71f0d94e2a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('articles', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # Конфигурация russian разбирает латиницу английским стеммером, кириллицу - русским
+    op.execute("""
+        CREATE FUNCTION articles_search_vector() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(NEW.content, '')), 'B');
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER articles_search_vector BEFORE INSERT OR UPDATE OF title, content ON articles
+        FOR EACH ROW EXECUTE FUNCTION articles_search_vector();
+    """)
+    # Заполнение существующих строк не должно менять их версию
+    op.execute("ALTER TABLE articles DISABLE TRIGGER articles_touch;")
+    op.execute("UPDATE articles SET title = title;")
+    op.execute("ALTER TABLE articles ENABLE TRIGGER articles_touch;")
+    op.create_index('ix_articles_search_vector', 'articles', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_articles_search_vector', table_name='articles')
+    op.execute("DROP TRIGGER articles_search_vector ON articles;")
+    op.execute("DROP FUNCTION articles_search_vector();")
+    op.drop_column('articles', 'search_vector')
@@ -0,0 +1,43 @@
+"""add articles version
+
+Revision ID: c71f0d94e2a5
+Revises: 3e8b5f0c2a61
+Create Date: 2026-10-18 12:40:03.915562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71f0d94e2a5'
+down_revision = '3e8b5f0c2a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('articles', sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+    op.add_column('articles', sa.Column('updated_at', sa.DateTime(timezone=True),
+                                        server_default=sa.text('now()'), nullable=False))
+    # Версия и время изменения обновляются при любом UPDATE, в том числе массовом и ручном
+    op.execute("""
+        CREATE FUNCTION articles_touch() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            NEW.updated_at := clock_timestamp();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER articles_touch BEFORE UPDATE ON articles
+        FOR EACH ROW EXECUTE FUNCTION articles_touch();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER articles_touch ON articles;")
+    op.execute("DROP FUNCTION articles_touch();")
+    op.drop_column('articles', 'updated_at')
+    op.drop_column('articles', 'version')
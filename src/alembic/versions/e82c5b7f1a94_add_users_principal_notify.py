@@ -0,0 +1,49 @@
+"""add users principal notify
+
+Revision ID: e82c5b7f1a94
+Revises: 6d2f41a8c953
+Create Date: 2026-10-18 21:40:07.512938
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e82c5b7f1a94'
+down_revision = '6d2f41a8c953'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Имя пользователя в канал principal_invalidate при смене роли, активности или
+    # имени и при удалении - любым путем (ORM, UPDATE, другой сервис). Уведомление
+    # доставляется после COMMIT, повторы в одной транзакции схлопываются
+    op.execute("""
+        CREATE FUNCTION users_principal_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('principal_invalidate', OLD.name);
+            IF TG_OP = 'UPDATE' AND NEW.name IS DISTINCT FROM OLD.name THEN
+                PERFORM pg_notify('principal_invalidate', NEW.name);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER users_principal_update AFTER UPDATE OF role, is_active, name ON users
+        FOR EACH ROW WHEN (OLD.role IS DISTINCT FROM NEW.role OR OLD.is_active IS DISTINCT FROM NEW.is_active
+                           OR OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION users_principal_notify();
+    """)
+    op.execute("""
+        CREATE TRIGGER users_principal_delete AFTER DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION users_principal_notify();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER users_principal_delete ON users;")
+    op.execute("DROP TRIGGER users_principal_update ON users;")
+    op.execute("DROP FUNCTION users_principal_notify();")
@@ -9,12 +9,7 @@ from alembic import op
 import sqlalchemy as sa
 from sqlalchemy.sql import table, column
 from sqlalchemy import String, Integer
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str):
-    return pwd_context.hash(password)
+from auth.passwords import password_hasher
 
 
 # revision identifiers, used by Alembic.
@@ -33,11 +28,12 @@ def upgrade() -> None:
         column('is_active', sa.Boolean),
         column('role', String)
     )
+    hashed = password_hasher.hash_many(['password1', 'password2', 'password3'])
     op.bulk_insert(users_table,
         [
-            {'email':'user1@example.com', 'name':'user1', 'hashed_password':hash_password('password1'), 'is_active':True, 'role':'admin'},
-            {'email':'user2@example.com', 'name':'user2', 'hashed_password':hash_password('password2'), 'is_active':True, 'role':'user'},   
-            {'email':'user3@example.com', 'name':'user3', 'hashed_password':hash_password('password3'), 'is_active':True, 'role':'user'}
+            {'email':'user1@example.com', 'name':'user1', 'hashed_password':hashed[0], 'is_active':True, 'role':'admin'},
+            {'email':'user2@example.com', 'name':'user2', 'hashed_password':hashed[1], 'is_active':True, 'role':'user'},   
+            {'email':'user3@example.com', 'name':'user3', 'hashed_password':hashed[2], 'is_active':True, 'role':'user'}
         ]
     )
 
@@ -0,0 +1,77 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+
+def article_etag(article: dict) -> str:
+    """ Строгий ETag статьи по ее версии """
+    return f'"{article["id"]}-{article["version"]}"'
+
+
+def articles_etag(articles: Iterable[dict], view: str = "full", total: Optional[int] = None) -> str:
+    """ Строгий ETag страницы: меняется при изменении состава или версии любой статьи и зависит от набора полей
+    и числа статей, если оно запрошено """
+    digest = hashlib.sha1(",".join(f'{article["id"]}:{article["version"]}' for article in articles).encode())
+    if view != "full":
+        digest.update(view.encode())
+    if total is not None:
+        digest.update(f"total:{total}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def last_modified(articles: Iterable[dict]) -> Optional[datetime]:
+    """ Время последнего изменения среди статей (значение из кэша может быть строкой) """
+    moments = [
+        datetime.fromisoformat(article["updated_at"]) if isinstance(article["updated_at"], str)
+        else article["updated_at"]
+        for article in articles
+    ]
+    return max(moments, default=None)
+
+
+def is_conditional(request: Request) -> bool:
+    """ Запрос содержит условные заголовки """
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, modified: Optional[datetime] = None) -> bool:
+    """ Проверка If-None-Match / If-Modified-Since (If-None-Match имеет приоритет) """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Для GET используется слабое сравнение: префикс W/ не учитывается
+        candidates = {_opaque_tag(tag.strip()) for tag in if_none_match.split(",")}
+        return etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return modified.replace(microsecond=0) <= since
+    return False
+
+
+def _opaque_tag(tag: str) -> str:
+    """ ETag без признака слабого валидатора (str.removeprefix нет в Python 3.8) """
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def set_validators(response: Response, etag: str, modified: Optional[datetime] = None):
+    """ Заголовки ETag и Last-Modified """
+    response.headers["ETag"] = etag
+    if modified is not None:
+        response.headers["Last-Modified"] = format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+
+
+def not_modified_response(etag: str, modified: Optional[datetime] = None) -> Response:
+    """ Ответ 304 с теми же валидаторами """
+    response = Response(status_code=304)
+    set_validators(response, etag, modified)
+    return response
@@ -0,0 +1,29 @@
+import csv
+import io
+from typing import AsyncIterator, List
+
+import orjson
+
+from db.db import VIEW_COLUMNS
+
+EXPORT_FIELDS = {view: [column.key for column in columns] for view, columns in VIEW_COLUMNS.items()}
+
+
+async def ndjson_lines(chunks: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    """ Статьи в формате NDJSON: одна пачка строк на пачку из базы """
+    async for chunk in chunks:
+        yield b"".join(orjson.dumps(article) + b"\n" for article in chunk)
+
+
+async def csv_lines(chunks: AsyncIterator[List[dict]], fields: List[str]) -> AsyncIterator[bytes]:
+    """ Статьи в формате CSV с заголовком из fields """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    async for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
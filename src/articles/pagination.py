@@ -0,0 +1,71 @@
+import base64
+import binascii
+import json
+from typing import Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    """ Курсор не удалось разобрать """
+
+
+def encode_cursor(after_id: int) -> str:
+    """ Непрозрачный курсор на следующую страницу (после статьи after_id) """
+    payload = json.dumps({"after": after_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """ id статьи, после которой начинается страница """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        after_id = json.loads(payload)["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(after_id, int):
+        raise InvalidCursor(cursor)
+    return after_id
+
+
+def encode_search_cursor(rank: float, after_id: int) -> str:
+    """ Курсор следующей страницы поиска (после статьи after_id с релевантностью rank) """
+    payload = json.dumps({"rank": rank, "after": after_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    """ Релевантность и id статьи, после которой начинается страница поиска """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        rank, after_id = payload["rank"], payload["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(after_id, int) or not isinstance(rank, (int, float)) or isinstance(rank, bool):
+        raise InvalidCursor(cursor)
+    return float(rank), after_id
+
+
+def next_cursor(articles: list, per_page: int) -> Optional[str]:
+    """ Курсор следующей страницы, если текущая заполнена целиком """
+    if len(articles) < per_page:
+        return None
+    return encode_cursor(articles[-1]["id"])
+
+
+def next_search_cursor(results: list, per_page: int) -> Optional[str]:
+    """ Курсор следующей страницы поиска, если текущая заполнена целиком """
+    if len(results) < per_page:
+        return None
+    return encode_search_cursor(results[-1]["rank"], results[-1]["id"])
+
+
+def page_total(articles: list, page: int, per_page: int, after_id: Optional[int] = None) -> Optional[int]:
+    """ Точное число статей, если страница с номером page последняя (неполная) - тогда его не нужно считать """
+    if after_id is None and len(articles) < per_page and (articles or page == 1):
+        return (page - 1) * per_page + len(articles)
+    return None
+
+
+def total_headers(response, total: dict):
+    """ Число статей в заголовках: X-Total-Count и X-Total-Count-Exact (true - точное, false - оценка) """
+    response.headers["X-Total-Count"] = str(total["total"])
+    response.headers["X-Total-Count-Exact"] = "true" if total["exact"] else "false"
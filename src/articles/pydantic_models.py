@@ -40,7 +40,36 @@ class ArticleCreate(ArticleBase):
 
 class Article_api(ArticleBase):
     id: int
+    # Столбец content допускает NULL (статьи, записанные мимо API)
+    content: Optional[str]
     
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class ArticleSummary(BaseModel):
+    title: str
+    published_date: Optional[date] = None
+    author_id: int
+    id: int
+
+class ArticleExcerpt(ArticleSummary):
+    excerpt: Optional[str]
+
+class ArticleSearchResult(Article_api):
+    rank: float
+
+
+class ArticleBulkUpdate(BaseModel):
+    id: int
+    title: str
+    content: str
+    published_date: Optional[date] = None
+
+class ArticleBulkResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+    article: Optional[Article_api] = None
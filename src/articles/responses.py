@@ -0,0 +1,39 @@
+from typing import List, Sequence, Union
+
+import orjson
+from fastapi import Response
+
+from articles.pydantic_models import Article_api, ArticleExcerpt, ArticleSearchResult, ArticleSummary
+
+ARTICLE_FIELDS = tuple(Article_api.model_fields)
+SEARCH_FIELDS = tuple(ArticleSearchResult.model_fields)
+VIEW_FIELDS = {
+    "full": ARTICLE_FIELDS,
+    "summary": tuple(ArticleSummary.model_fields),
+    "excerpt": tuple(ArticleExcerpt.model_fields),
+}
+
+
+def article_json(article: dict, fields: Sequence[str] = ARTICLE_FIELDS) -> dict:
+    """ Поля статьи, которые отдает Article_api (или другая модель ответа) """
+    return {field: article[field] for field in fields}
+
+
+def fast_json_response(data: Union[dict, List[dict]], response: Response,
+                       fields: Sequence[str] = ARTICLE_FIELDS) -> Response:
+    """ JSON-ответ напрямую из строк базы или кэша через orjson.
+
+    Данные уже прошли проверку при записи, поэтому повторная валидация
+    response_model и jsonable_encoder пропускаются; схема OpenAPI по-прежнему
+    описывается response_model маршрута. Заголовки из response (ETag,
+    X-Next-Cursor) переносятся в ответ.
+    """
+    if isinstance(data, list):
+        content = orjson.dumps([article_json(article, fields) for article in data])
+    else:
+        content = orjson.dumps(article_json(data, fields))
+    fast_response = Response(content=content, media_type="application/json")
+    for name, value in response.headers.items():
+        if name != "content-length":
+            fast_response.headers[name] = value
+    return fast_response
@@ -1,32 +1,164 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from articles.pydantic_models import Article_api, ArticleBase, User_api
+from typing import List, Optional, Union
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from articles.pydantic_models import (Article_api, ArticleBase, ArticleBulkResult, ArticleBulkUpdate,
+                                     ArticleExcerpt, ArticleSearchResult, ArticleSummary, User_api)
 from db.db_models import Article
 from auth.auth import get_current_user
-from db.db import DatabaseManager
+from db.batching import WriteQueueFull
+from db.db import DatabaseManager, NotEnoughPermissions, get_db_manager
+from articles.pagination import (InvalidCursor, decode_cursor, decode_search_cursor, next_cursor,
+                                 next_search_cursor, page_total, total_headers)
+from articles.export import EXPORT_FIELDS, csv_lines, ndjson_lines
+from articles.conditional import (article_etag, articles_etag, is_conditional, is_not_modified, last_modified,
+                                  not_modified_response, set_validators)
 from fastapi import Query
 from datetime import date
+from articles.responses import SEARCH_FIELDS, VIEW_FIELDS, fast_json_response
+from compression.middleware import precompress
+from config import ARTICLES_BULK_MAX, ARTICLES_EXPORT_CHUNK, ARTICLES_WRITE_BEHIND, FAST_JSON_RESPONSES
 
 router = APIRouter(
     prefix="/articles",
     tags=["articles"]
 )
 
-@router.get("/{article_id}", response_model=Article_api)
+def check_bulk_size(items: list):
+    """Проверка размера пачки для массовых операций"""
+    if not items:
+        raise HTTPException(status_code=422, detail="Empty batch")
+    if len(items) > ARTICLES_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {ARTICLES_BULK_MAX} items")
+
+def with_index(results: list) -> list:
+    """Результаты пачки с номером элемента в запросе"""
+    return [{"index": index, **result} for index, result in enumerate(results)]
+
+# Маршруты /bulk объявлены раньше /{article_id}, иначе "bulk" попадет в article_id
+@router.post("/bulk", response_model=List[ArticleBulkResult])
+async def create_articles_bulk(articles: List[ArticleBase],
+                               current_user: User_api = Depends(get_current_user),
+                               db_manager: DatabaseManager = Depends(get_db_manager)):
+    check_bulk_size(articles)
+    created = await db_manager.add_articles([
+        {
+            "title": article.title,
+            "content": article.content,
+            "published_date": article.published_date,
+            "author_id": current_user['id'],
+        }
+        for article in articles
+    ])
+    return with_index([{"id": article["id"], "status_code": 200, "article": article} for article in created])
+
+@router.patch("/bulk", response_model=List[ArticleBulkResult])
+async def update_articles_bulk(articles: List[ArticleBulkUpdate],
+                               current_user: User_api = Depends(get_current_user),
+                               db_manager: DatabaseManager = Depends(get_db_manager)):
+    check_bulk_size(articles)
+    results = await db_manager.update_articles([article.model_dump() for article in articles],
+                                               current_user['id'], current_user['role'] == 'admin')
+    return with_index(results)
+
+@router.delete("/bulk", response_model=List[ArticleBulkResult])
+async def delete_articles_bulk(article_ids: List[int] = Body(...),
+                               current_user: User_api = Depends(get_current_user),
+                               db_manager: DatabaseManager = Depends(get_db_manager)):
+    check_bulk_size(article_ids)
+    results = await db_manager.delete_articles(article_ids, current_user['id'], current_user['role'] == 'admin')
+    return with_index(results)
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+VIEW_QUERY = Query("full", pattern="^(full|summary|excerpt)$",
+                   description="full - все поля; summary - без content; excerpt - summary и начало content")
+
+@router.get("/export")
+async def export_articles(export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+                          author_id: Optional[int] = None,
+                          date_form: Optional[date] = None,
+                          view: str = VIEW_QUERY,
+                          db_manager: DatabaseManager = Depends(get_db_manager)):
+    # При отключении клиента Starlette отменяет отправку, генератор закрывается
+    # и вместе с ним серверный курсор и соединение
+    chunks = db_manager.stream_articles(author_id, date_form, ARTICLES_EXPORT_CHUNK, view)
+    if export_format == "csv":
+        body = csv_lines(chunks, EXPORT_FIELDS[view])
+    else:
+        body = ndjson_lines(chunks)
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="articles.{export_format}"'})
+
+@router.get("/search", response_model=List[ArticleSearchResult])
+async def search_articles(request: Request,
+                          response: Response,
+                          q: str = Query(..., min_length=1, max_length=200, description="Поисковый запрос "
+                                         "(синтаксис websearch: \"фраза\", or, -исключение)"),
+                          per_page: int = Query(10, ge=1, le=100),
+                          cursor: Optional[str] = Query(None, description="Значение заголовка X-Next-Cursor "
+                                                                          "предыдущей страницы"),
+                          db_manager: DatabaseManager = Depends(get_db_manager)):
+    after_rank = after_id = None
+    if cursor is not None:
+        try:
+            after_rank, after_id = decode_search_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Один ключ кэша для запросов, которые отличаются только пробелами
+    results = await db_manager.search_articles(" ".join(q.split()), per_page, after_rank, after_id)
+    cursor = next_search_cursor(results, per_page)
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor
+    precompress(request)
+    if FAST_JSON_RESPONSES:
+        return fast_json_response(results, response, SEARCH_FIELDS)
+    return results
+
+NOT_MODIFIED = {304: {"description": "Not Modified"}}
+
+@router.get("/{article_id}", response_model=Article_api, responses=NOT_MODIFIED)
 async def read_article(article_id: int,
-                        db_manager: DatabaseManager = Depends(DatabaseManager)):
+                        request: Request,
+                        response: Response,
+                        db_manager: DatabaseManager = Depends(get_db_manager)):
+    if is_conditional(request):
+        # Сначала проверяется только версия, текст статьи загружается, если она изменилась
+        version = await db_manager.get_article_version(article_id)
+        if version is not None:
+            etag, modified = article_etag(version), last_modified([version])
+            if is_not_modified(request, etag, modified):
+                return not_modified_response(etag, modified)
     article = await db_manager.get_article_by_id(article_id)
-    await db_manager.close()
     if article is None:
         raise HTTPException(status_code=404, detail="Article not found")
+    etag, modified = article_etag(article), last_modified([article])
+    if is_not_modified(request, etag, modified):
+        return not_modified_response(etag, modified)
+    set_validators(response, etag, modified)
+    precompress(request)
+    if FAST_JSON_RESPONSES:
+        return fast_json_response(article, response)
     return article
 
 @router.post("/", response_model=Article_api)
 async def create_article(
     article: ArticleBase, 
     current_user: User_api = Depends(get_current_user),
-    db_manager: DatabaseManager = Depends(DatabaseManager)
+    db_manager: DatabaseManager = Depends(get_db_manager)
     ):
+    if ARTICLES_WRITE_BEHIND:
+        try:
+            return await db_manager.enqueue_article({
+                "title": article.title,
+                "content": article.content,
+                "author_id": current_user['id'],
+                "published_date": article.published_date,
+            })
+        except WriteQueueFull:
+            raise HTTPException(status_code=503, detail="Too many pending writes", headers={"Retry-After": "1"})
     new_article = Article(
         title=article.title, 
         content=article.content,
@@ -34,46 +166,85 @@ async def create_article(
         published_date=article.published_date
     )
     await db_manager.add_article(new_article)
-    await db_manager.close()
     return new_article
 
 @router.put("/{article_id}", response_model=Article_api)
 async def update_article(article_id: int, article: ArticleBase,
                           current_user: User_api = Depends(get_current_user),
-                          db_manager: DatabaseManager = Depends(DatabaseManager)
+                          db_manager: DatabaseManager = Depends(get_db_manager)
                           ): 
-    updated_article = await db_manager.update_article(article_id, article)
+    try:
+        updated_article = await db_manager.update_article(article_id, article, current_user['id'],
+                                                          current_user['role'] == 'admin')
+    except NotEnoughPermissions:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
     if updated_article is None:
         raise HTTPException(status_code=404, detail="Article not found")
-    user_id = current_user['id']
-    author_id = await db_manager.get_user_id_by_article_id(article_id)
-    await db_manager.close()
-    if current_user['role'] != 'admin' and user_id != author_id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
     return updated_article
 
 @router.delete("/{article_id}", response_model=Article_api)
 async def delete_article(article_id: int,
                         current_user: User_api = Depends(get_current_user),
-                        db_manager: DatabaseManager = Depends(DatabaseManager)):
-    
-    user_id = current_user['id']
-    author_id = await db_manager.get_user_id_by_article_id(article_id)
-    if current_user['role'] != 'admin' and user_id != author_id:
+                        db_manager: DatabaseManager = Depends(get_db_manager)):
+    try:
+        deleted_article = await db_manager.delete_article(article_id, current_user['id'],
+                                                          current_user['role'] == 'admin')
+    except NotEnoughPermissions:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    deleted_article = await db_manager.delete_article(article_id)
-    await db_manager.close()
     if deleted_article is None:
         raise HTTPException(status_code=404, detail="Article not found")
     return deleted_article
 
-@router.get("/", response_model=List[Article_api])
-async def read_articles(page: int = Query(1, ge=1),
+@router.get("/", response_model=Union[List[Article_api], List[ArticleExcerpt], List[ArticleSummary]],
+            responses=NOT_MODIFIED)
+async def read_articles(request: Request,
+                        response: Response,
+                        page: int = Query(1, ge=1),
                         per_page: int = Query(10, ge=1, le=200),
                         author_id: Optional[int] = None,
                         date_form: Optional[date] = None,
-                        db_manager: DatabaseManager = Depends(DatabaseManager)):
+                        cursor: Optional[str] = Query(None, description="Значение заголовка X-Next-Cursor "
+                                                                        "предыдущей страницы; page при этом не используется"),
+                        view: str = VIEW_QUERY,
+                        with_total: bool = Query(False, description="Число статей в заголовке X-Total-Count; "
+                                                                    "X-Total-Count-Exact=false, если это оценка"),
+                        db_manager: DatabaseManager = Depends(get_db_manager)):
+    after_id = None
+    if cursor is not None:
+        try:
+            after_id = decode_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        page = 1
 
-    articles = await db_manager.get_articles(page, per_page, author_id, date_form)
-    await db_manager.close()
+    articles = await db_manager.get_articles(page, per_page, author_id, date_form, after_id, view)
+    cursor = next_cursor(articles, per_page)
+    total = None
+    if with_total:
+        exact = page_total(articles, page, per_page, after_id)
+        if exact is not None:
+            total = {"total": exact, "exact": True}
+        else:
+            total = await db_manager.count_articles(author_id, date_form)
+            if after_id is None:
+                # Оценка не может быть меньше числа уже показанных статей
+                total = {**total, "total": max(total["total"], (page - 1) * per_page + len(articles))}
+    # Состав страницы и версии статей определяют ETag; If-Modified-Since для
+    # списка не проверяется, т.к. удаление статьи не меняет Last-Modified
+    etag = articles_etag(articles, view, total and total["total"])
+    modified = last_modified(articles)
+    not_modified = is_not_modified(request, etag)
+    if not_modified:
+        response = not_modified_response(etag, modified)
+    else:
+        set_validators(response, etag, modified)
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor
+    if total is not None:
+        total_headers(response, total)
+    if not_modified:
+        return response
+    precompress(request)
+    if FAST_JSON_RESPONSES:
+        return fast_json_response(articles, response, VIEW_FIELDS[view])
     return articles
\ No newline at end of file
@@ -1,29 +1,40 @@
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from typing import Optional
-from db.db import DatabaseManager
+from db.db import DatabaseManager, get_db_manager
+from auth.principal_cache import principal_cache, token_digest
+from auth.passwords import PasswordHasherBusy, password_hasher
 from config import SECRET_KEY, ALGORITHM
+from metrics.metrics import PASSWORD_HASH_SECONDS
 
+# Метрика подключается здесь: auth.passwords импортируют скрипты без prometheus_client
+password_hasher.observe = lambda operation, seconds: PASSWORD_HASH_SECONDS.labels(operation).observe(seconds)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password: str, hashed_password: str):
+async def verify_password(plain_password: str, hashed_password: str):
     """Функция для проверки пароля пользователя"""
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
 
-async def authenticate_user( username: str, password: str, db_manager: DatabaseManager = Depends(DatabaseManager)):
+async def authenticate_user( username: str, password: str, db_manager: DatabaseManager):
     """ Функция для аутентификации пользователя"""
-    users_dict = await db_manager.get_users_dict()
+    user = await db_manager.get_user_by_username(username)
+    # Соединение возвращается в пул до bcrypt: иначе вход ждет очереди потоков,
+    # удерживая соединение в открытой транзакции
     await db_manager.close()
-    user = next((user for user in users_dict if user['name'] == username), None)
     if not user:
         return False
-    if not verify_password(password, user['hashed_password']):
+    if not await verify_password(password, user['hashed_password']):
         return False
     return user
 
@@ -38,8 +49,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db_manager: DatabaseManager = Depends(get_db_manager)):
     """Функция для получения текущего пользователя"""
+    digest = token_digest(token)
+    principal = await principal_cache.get(digest)
+    if principal is not None:
+        return principal
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -52,9 +68,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    db_manager = DatabaseManager()
     user = await db_manager.get_user_by_username(username)
-    await db_manager.close()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    principal = {key: value for key, value in user.items() if key != 'hashed_password'}
+    await principal_cache.set(digest, principal, payload.get("exp"))
+    return principal
\ No newline at end of file
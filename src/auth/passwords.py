@@ -0,0 +1,65 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from passlib.context import CryptContext
+
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordHasherBusy(Exception):
+    """ Очередь на проверку паролей переполнена """
+
+
+class PasswordHasher:
+    """ Хэширование и проверка паролей bcrypt в отдельном пуле потоков.
+
+    bcrypt занимает процессор на десятки миллисекунд и не должен блокировать
+    event loop. Одновременно выполняется не больше workers операций, ещё
+    queue_size ждут своей очереди, остальные сразу получают PasswordHasherBusy.
+    observe(operation, seconds) получает чистое время bcrypt (без ожидания в очереди).
+    """
+    def __init__(self, workers: int, queue_size: int,
+                 observe: Optional[Callable[[str, float], None]] = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.observe = observe
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """ Проверка пароля """
+        return await self._run("verify", pwd_context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        """ Хэширование пароля """
+        return await self._run("hash", pwd_context.hash, password)
+
+    def hash_many(self, passwords: Iterable[str]) -> List[str]:
+        """ Синхронное хэширование нескольких паролей параллельно (для миграций и скриптов) """
+        return list(self._executor.map(pwd_context.hash, passwords))
+
+    async def _run(self, operation: str, func, *args):
+        if self.pending >= self.workers + self.queue_size:
+            raise PasswordHasherBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, operation,
+                                                                    func, *args)
+        finally:
+            self.pending -= 1
+
+    def _timed(self, operation: str, func, *args):
+        """ Вызов в потоке пула с замером времени bcrypt """
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if self.observe is not None:
+                self.observe(operation, time.perf_counter() - started)
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from aiocache import Cache
+from aiocache.serializers import JsonSerializer
+from sqlalchemy import event, inspect
+
+from config import (PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_REDIS, PRINCIPAL_CACHE_BROADCAST,
+                    REDIS_HOST, REDIS_PORT)
+from db.cache import InvalidationChannel
+from db.db_models import User
+from db.notifications import DatabaseListener
+from metrics.metrics import register_cache
+
+logger = logging.getLogger(__name__)
+
+# Изменение этих полей должно сразу отражаться на правах уже выданных токенов
+INVALIDATING_FIELDS = ('role', 'is_active')
+# Канал NOTIFY триггеров users_principal_* (миграция e82c5b7f1a94)
+NOTIFY_CHANNEL = 'principal_invalidate'
+
+
+def token_digest(token: str) -> str:
+    """ Ключ кэша: токен целиком не хранится """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PrincipalCache:
+    """ Кэш пользователей по токену: LRU в процессе и необязательный уровень в Redis.
+
+    Запись живет не дольше ttl и не дольше срока действия токена (exp). Сброс
+    пользователя рассылается другим процессам через channel в Redis broadcast
+    (по умолчанию - тот же Redis, что и у уровня кэша); канал работает и без
+    уровня кэша в Redis.
+    """
+    def __init__(self, maxsize: int, ttl: int, redis: Optional[Cache] = None, channel: Optional[str] = None,
+                 broadcast: Optional[Cache] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis = redis
+        broadcast = broadcast or redis
+        self.channel = InvalidationChannel(broadcast, channel, self._drop_user) if broadcast and channel else None
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._digests_by_user: Dict[str, Set[str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = Counter()
+
+    async def get(self, digest: str) -> Optional[dict]:
+        """ Получение пользователя по хэшу токена """
+        entry = self._entries.get(digest)
+        if entry is not None:
+            expires_at, user = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(digest)
+                self.stats['hits_local'] += 1
+                return user
+            self._discard(digest)
+        user = await self._get_remote(digest) if self.redis is not None else None
+        self.stats['misses' if user is None else 'hits_redis'] += 1
+        return user
+
+    async def _get_remote(self, digest: str) -> Optional[dict]:
+        try:
+            stored = await self.redis.get(digest)
+            if stored is None:
+                return None
+            version = await self.redis.get(self._version_key(stored['user']['name']))
+        except Exception:
+            logger.warning("Principal cache: Redis is unavailable", exc_info=True)
+            self.stats['errors'] += 1
+            return None
+        if stored['version'] != (version or 0) or stored['expires_at'] <= time.time():
+            return None
+        self._store(digest, stored['user'], stored['expires_at'])
+        return stored['user']
+
+    async def set(self, digest: str, user: dict, exp: Optional[float] = None):
+        """ Сохранение пользователя до истечения ttl или срока действия токена """
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= time.time():
+            return
+        self._store(digest, user, expires_at)
+        if self.redis is None:
+            return
+        try:
+            version = await self.redis.get(self._version_key(user['name']))
+            await self.redis.set(
+                digest,
+                {"user": user, "version": version or 0, "expires_at": expires_at},
+                ttl=max(1, math.ceil(expires_at - time.time())),
+            )
+        except Exception:
+            logger.warning("Principal cache: Redis is unavailable", exc_info=True)
+
+    def invalidate_user(self, username: str, broadcast: bool = True):
+        """ Удаление всех записей пользователя (в Redis - через смену версии).
+
+        broadcast=False - сброс уже разослан всем процессам (уведомлением из базы).
+        """
+        self._drop_user(username)
+        if self.redis is None and (self.channel is None or not broadcast):
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._propagate(username, broadcast))
+        except RuntimeError:
+            # Вне event loop (например, в скрипте) Redis обновит процесс приложения
+            # по уведомлению триггера users_principal_*
+            logger.debug("Principal cache: no running loop, %s is reset by the database notification", username)
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def clear(self):
+        """ Очистка кэша процесса """
+        self._entries.clear()
+        self._digests_by_user.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """ Счетчики попаданий и промахов """
+        return {"get_current_user": dict(self.stats)}
+
+    async def _propagate(self, username: str, broadcast: bool):
+        """ Смена версии в Redis и рассылка сброса другим процессам """
+        try:
+            if self.redis is not None:
+                await self.redis.increment(self._version_key(username))
+            if self.channel is not None and broadcast:
+                await self.channel.publish(username)
+        except Exception:
+            logger.warning("Principal cache: Redis is unavailable", exc_info=True)
+
+    def _drop_user(self, username: str):
+        for digest in self._digests_by_user.pop(username, set()):
+            self._entries.pop(digest, None)
+
+    def _store(self, digest: str, user: dict, expires_at: float):
+        self._entries[digest] = (expires_at, user)
+        self._entries.move_to_end(digest)
+        self._digests_by_user.setdefault(user['name'], set()).add(digest)
+        while len(self._entries) > self.maxsize:
+            oldest, (_, oldest_user) = self._entries.popitem(last=False)
+            self._forget(oldest, oldest_user['name'])
+
+    def _discard(self, digest: str):
+        _, user = self._entries.pop(digest)
+        self._forget(digest, user['name'])
+
+    def _forget(self, digest: str, username: str):
+        digests = self._digests_by_user.get(username)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._digests_by_user[username]
+
+    @staticmethod
+    def _version_key(username: str) -> str:
+        return f"version:{username}"
+
+
+principal_cache = PrincipalCache(
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    Cache(Cache.REDIS, endpoint=REDIS_HOST, port=REDIS_PORT, namespace="principal",
+          serializer=JsonSerializer()) if PRINCIPAL_CACHE_REDIS else None,
+    channel="principal:invalidate",
+    broadcast=Cache(Cache.REDIS, endpoint=REDIS_HOST, port=REDIS_PORT) if PRINCIPAL_CACHE_BROADCAST else None,
+)
+register_cache("principals", principal_cache.snapshot)
+
+
+def listen_for_user_changes(url) -> DatabaseListener:
+    """ Сброс кэша по уведомлениям базы: изменения через Core, SQL и другие сервисы тоже доходят """
+    return DatabaseListener(url, NOTIFY_CHANNEL, lambda username: principal_cache.invalidate_user(username, False),
+                            on_connect=principal_cache.clear)
+
+
+@event.listens_for(User, 'after_update')
+def invalidate_changed_user(mapper, connection, target):
+    """ Сброс кэша при изменении роли или активности пользователя через ORM (сразу, до уведомления базы) """
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in INVALIDATING_FIELDS):
+        for username in {target.name, *state.attrs['name'].history.deleted}:
+            principal_cache.invalidate_user(username)
+
+
+@event.listens_for(User, 'after_delete')
+def invalidate_deleted_user(mapper, connection, target):
+    """ Сброс кэша при удалении пользователя """
+    principal_cache.invalidate_user(target.name)
@@ -0,0 +1,78 @@
+""" Хвостовая задержка GET /articles/{id} во время потока входов в /auth/token.
+
+Запуск из каталога src (в процессе, через ASGI):
+
+    python -m benchmarks.auth_contention --logins 32 --duration 10
+
+или против запущенного сервера: --url http://localhost:90
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.common import report, summarize
+from config import TEST_USERNAME, TEST_PASSWORD
+
+
+async def read_article_loop(client: httpx.AsyncClient, article_id: int, deadline: float) -> list:
+    """ Последовательные чтения статьи до истечения времени """
+    samples = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get(f"/articles/{article_id}")
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return samples
+
+
+async def login_loop(client: httpx.AsyncClient, deadline: float, statuses: Counter):
+    """ Непрерывные попытки входа """
+    while time.perf_counter() < deadline:
+        response = await client.post("/auth/token", json={"username": TEST_USERNAME, "password": TEST_PASSWORD})
+        statuses[response.status_code] += 1
+
+
+async def run_phase(client: httpx.AsyncClient, article_id: int, logins: int, duration: float) -> dict:
+    deadline = time.perf_counter() + duration
+    statuses = Counter()
+    results = await asyncio.gather(
+        read_article_loop(client, article_id, deadline),
+        *(login_loop(client, deadline, statuses) for _ in range(logins)),
+    )
+    return {
+        "concurrent_logins": logins,
+        "read_article": summarize(results[0]),
+        "login_statuses": dict(statuses),
+        "logins_per_second": round(sum(statuses.values()) / duration, 1),
+    }
+
+
+async def run(url: str, article_id: int, logins: int, duration: float):
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+    else:
+        from main import app
+        client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=60)
+    async with client:
+        results = [
+            await run_phase(client, article_id, 0, duration),
+            await run_phase(client, article_id, logins, duration),
+        ]
+    report("auth_contention", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='', help='адрес сервера; по умолчанию приложение запускается в процессе')
+    parser.add_argument('--article-id', type=int, default=1)
+    parser.add_argument('--logins', type=int, default=32, help='число параллельных клиентов входа')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность каждой фазы, секунды')
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.article_id, args.logins, args.duration))
+
+
+if __name__ == '__main__':
+    main()
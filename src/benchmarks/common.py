@@ -0,0 +1,87 @@
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from db.db import DatabaseManager
+
+
+def summarize(samples: List[float]) -> dict:
+    """ Сводка по замерам (секунды) в миллисекундах """
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def measure(func: Callable[[], Awaitable], iterations: int, warmup: int = 5) -> dict:
+    """ Последовательный замер задержки асинхронной функции """
+    for _ in range(warmup):
+        await func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+@asynccontextmanager
+async def bench_db_manager(test_mode: bool = True) -> AsyncIterator[DatabaseManager]:
+    """ Менеджер базы данных с одной сессией на весь прогон """
+    db_manager = DatabaseManager(test_mode=test_mode)
+    db_manager.session = db_manager.async_session_maker()
+    try:
+        yield db_manager
+    finally:
+        await db_manager.close()
+
+
+def report(name: str, results: Any, output: Optional[str] = None):
+    """ Вывод результатов в формате JSON (и сохранение в файл, если он указан) """
+    document = json.dumps({"benchmark": name, "results": results}, ensure_ascii=False, indent=2, default=str)
+    print(document)
+    if output:
+        with open(output, "w") as file:
+            file.write(document + "\n")
+
+
+def load_report(path: str) -> dict:
+    """ Результаты, ранее сохраненные report() """
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> dict:
+    """ Сравнение сводок по сценариям с базовым прогоном.
+
+    Регрессией считается падение пропускной способности или рост p95/p99
+    больше чем на threshold (доля).
+    """
+    comparison = {}
+    regressions = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        changes = {}
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if base.get(metric):
+                changes[metric] = round(stats[metric] / base[metric] - 1, 3)
+        comparison[name] = changes
+        if changes.get("throughput_rps", 0) < -threshold:
+            regressions.append(f"{name}: throughput {changes['throughput_rps']:+.1%}")
+        for metric in ("p95_ms", "p99_ms"):
+            if changes.get(metric, 0) > threshold:
+                regressions.append(f"{name}: {metric} {changes[metric]:+.1%}")
+    return {"changes": comparison, "regressions": regressions}
@@ -0,0 +1,56 @@
+""" Сжатие страницы статей: размер и время для каждого алгоритма, с кэшем сжатых тел (по ETag или хэшу) и без него.
+
+Запуск из каталога src (база не нужна):
+
+    python -m benchmarks.compression --rows 20 200
+"""
+import argparse
+import asyncio
+
+import orjson
+
+from benchmarks.common import measure, report
+from benchmarks.serialization import make_articles
+from compression.codecs import available_codecs
+from compression.middleware import CompressedBodies
+from config import COMPRESSION_ENCODINGS
+
+
+async def run(sizes, iterations: int):
+    codecs = available_codecs(COMPRESSION_ENCODINGS)
+    results = []
+    for rows in sizes:
+        body = orjson.dumps(make_articles(rows))
+        row = {"rows": rows, "bytes": len(body)}
+        for name, codec in codecs.items():
+            bodies = CompressedBodies(size=10)
+
+            async def compress():
+                return codec.compress(body)
+
+            async def cached():
+                return bodies.get_or_compress(codec, body, '/articles/ "etag"')
+
+            async def hashed():
+                return bodies.get_or_compress(codec, body)
+
+            row[name] = {
+                "bytes": len(codec.compress(body)),
+                "compress": await measure(compress, iterations),
+                "cached_by_etag": await measure(cached, iterations),
+                "cached_by_hash": await measure(hashed, iterations),
+            }
+        results.append(row)
+    report("compression", {"encodings": list(codecs), "pages": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[20, 200])
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+""" Синтетический набор данных большого объема для бенчмарков и оценки емкости.
+
+Запуск из каталога src:
+
+    python -m benchmarks.dataset --users 100000 --articles 10000000 --seed 42 --jobs 8
+
+Строки загружаются через COPY несколькими процессами (--jobs), каждый пишет
+свои пачки по --chunk строк. Содержимое зависит только от --seed и размеров:
+пачка генерируется своим генератором случайных чисел, id задаются явно
+(начиная с --id-offset + 1), хэш пароля считается один раз с солью из seed.
+Поэтому два прогона с одинаковыми параметрами дают одинаковые строки, что
+можно проверить с --checksum.
+
+Распределения: число статей у авторов - степенное (10% авторов пишут около
+половины статей), даты смещены к концу периода, длина текста - логнормальная
+(медиана около 1200 символов), слова текста - по закону Ципфа.
+
+Сгенерированные строки - пользователи с id больше --id-offset и именем с
+префиксом DATASET_USER_PREFIX и их статьи: без --replace загрузка поверх них не
+выполняется, с --replace они удаляются. Последовательности id не сдвигаются,
+поэтому строки приложения остаются ниже --id-offset; если последовательность
+уже дошла до него, загрузка не выполняется.
+Вторичные индексы статей на время загрузки удаляются и затем строятся
+заново параллельно (--keep-indexes оставляет их). Основную часть времени
+загрузки статьи занимает триггер search_vector; --no-search-vector
+отключает его на время загрузки.
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List, Tuple
+
+import asyncpg
+
+from auth.passwords import pwd_context
+from benchmarks.common import report
+from benchmarks.seed import BENCH_PASSWORD, BENCH_WORDS
+from config import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+from db.db_models import Article, User
+
+DATASET_USER_PREFIX = 'dataset_user_'
+USER_COLUMNS = ('id', 'email', 'name', 'hashed_password', 'is_active', 'role')
+ARTICLE_COLUMNS = ('id', 'title', 'content', 'published_date', 'author_id', 'updated_at')
+
+FIRST_DATE = date(2015, 1, 1)
+LAST_DATE = date(2025, 12, 31)
+# Доля статей автора с номером < x*users равна x ** (1 / AUTHOR_SKEW)
+AUTHOR_SKEW = 3.0
+# Доля статей за первые x периода равна x ** (1 / DATE_SKEW): новых статей больше
+DATE_SKEW = 0.6
+UNDATED_SHARE = 0.01
+CONTENT_MEDIAN = 1200
+CONTENT_SIGMA = 0.9
+CONTENT_LIMITS = (80, 40000)
+VOCABULARY_SIZE = 20000
+CORPUS_WORDS = 400000
+SYLLABLES = ['ka', 'ro', 'mi', 'sto', 'ven', 'la', 'dor', 'pre', 'ti', 'ax', 'lum', 'qua', 'ser', 'no',
+             'bel', 'zu', 'phi', 'tra', 'gen', 'os']
+# Триггер из миграции b4d17a6c9e30: to_tsvector - основная стоимость загрузки статьи
+SEARCH_TRIGGER = 'articles_search_vector'
+BCRYPT_SALT_CHARS = './ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+
+def connection_options(test_mode: bool) -> dict:
+    return {"user": DB_USER, "password": DB_PASSWORD, "host": DB_HOST, "port": int(DB_PORT),
+            "database": f'test_{DB_NAME}' if test_mode else DB_NAME}
+
+
+def password_hash(seed: int) -> str:
+    """ Один хэш BENCH_PASSWORD на всех пользователей; соль из seed, чтобы хэш тоже повторялся """
+    rng = random.Random(f"{seed}:salt")
+    # Последний символ соли bcrypt несет только 2 бита
+    salt = "".join(rng.choice(BCRYPT_SALT_CHARS) for _ in range(21)) + rng.choice(".Oeu")
+    return pwd_context.handler("bcrypt").using(salt=salt).hash(BENCH_PASSWORD)
+
+
+@functools.lru_cache(maxsize=1)
+def corpus(seed: int) -> str:
+    """ Текст, из которого вырезаются заголовки и тексты статей: слова с частотами по Ципфу """
+    rng = random.Random(f"{seed}:corpus")
+    words = set(BENCH_WORDS)
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    vocabulary = sorted(words)
+    rng.shuffle(vocabulary)
+    weights = list(itertools.accumulate(1 / rank ** 1.07 for rank in range(1, len(vocabulary) + 1)))
+    return " ".join(rng.choices(vocabulary, cum_weights=weights, k=CORPUS_WORDS))
+
+
+def user_rows(seed: int, start: int, stop: int, id_offset: int, hashed_password: str) -> Iterator[Tuple]:
+    rng = random.Random(f"{seed}:users:{start}")
+    for index in range(start, stop):
+        name = f"{DATASET_USER_PREFIX}{index}"
+        yield (id_offset + 1 + index, f"{name}@example.com", name, hashed_password,
+               rng.random() >= 0.01, 'admin' if rng.random() < 0.001 else 'user')
+
+
+def article_rows(seed: int, start: int, stop: int, id_offset: int, users: int) -> Iterator[Tuple]:
+    rng = random.Random(f"{seed}:articles:{start}")
+    text = corpus(seed)
+    span = (LAST_DATE - FIRST_DATE).days
+    mu = math.log(CONTENT_MEDIAN)
+    for index in range(start, stop):
+        length = min(CONTENT_LIMITS[1], max(CONTENT_LIMITS[0], int(rng.lognormvariate(mu, CONTENT_SIGMA))))
+        offset = text.find(" ", rng.randrange(len(text) - CONTENT_LIMITS[1])) + 1
+        title_offset = text.find(" ", rng.randrange(len(text) - 100)) + 1
+        title = text[title_offset:title_offset + rng.randint(15, 80)].strip().capitalize()
+        author_id = id_offset + 1 + min(users - 1, int(users * rng.random() ** AUTHOR_SKEW))
+        published_date = None
+        if rng.random() >= UNDATED_SHARE:
+            published_date = FIRST_DATE + timedelta(days=int(span * rng.random() ** DATE_SKEW))
+        moment = published_date or FIRST_DATE
+        updated_at = datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc)
+        yield (id_offset + 1 + index, title, text[offset:offset + length], published_date, author_id, updated_at)
+
+
+async def copy_chunk(options: dict, table: str, columns: Tuple[str, ...], rows: Iterator[Tuple]):
+    connection = await asyncpg.connect(**options)
+    try:
+        await connection.copy_records_to_table(table, records=rows, columns=columns)
+    finally:
+        await connection.close()
+
+
+def load_chunk(task: tuple) -> int:
+    """ Загрузка одной пачки в отдельном процессе """
+    table, options, seed, start, stop, id_offset, extra = task
+    if table == User.__tablename__:
+        rows, columns = user_rows(seed, start, stop, id_offset, extra), USER_COLUMNS
+    else:
+        rows, columns = article_rows(seed, start, stop, id_offset, extra), ARTICLE_COLUMNS
+    asyncio.run(copy_chunk(options, table, columns, rows))
+    return stop - start
+
+
+def load(executor: ProcessPoolExecutor, table: str, total: int, chunk: int, task_args: tuple) -> float:
+    options, seed, id_offset, extra = task_args
+    started = time.perf_counter()
+    tasks = [(table, options, seed, start, min(total, start + chunk), id_offset, extra)
+             for start in range(0, total, chunk)]
+    loaded = 0
+    for rows in executor.map(load_chunk, tasks):
+        loaded += rows
+        print(f"{table}: {loaded}/{total}", flush=True)
+    return time.perf_counter() - started
+
+
+async def secondary_indexes(connection, table: str) -> List[Tuple[str, str]]:
+    """ Индексы таблицы, кроме ограничений (первичного ключа и уникальных) """
+    return [tuple(row) for row in await connection.fetch(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.schemaname = current_schema() AND i.tablename = $1 AND NOT EXISTS ("
+        "  SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)", table)]
+
+
+async def restore(options: dict, definitions: List[Tuple[str, str]]):
+    """ Включение триггера search_vector и параллельное построение индексов, каждого в своем соединении """
+    async def execute(statement: str):
+        connection = await asyncpg.connect(**options)
+        try:
+            await connection.execute(statement)
+        finally:
+            await connection.close()
+    await execute(f"ALTER TABLE {Article.__tablename__} ENABLE TRIGGER {SEARCH_TRIGGER}")
+    await asyncio.gather(*(execute(definition) for _, definition in definitions))
+
+
+def generated_users(id_offset: str, prefix: str) -> str:
+    """ Запрос id сгенерированных пользователей; id_offset и prefix - параметры запроса """
+    return f"SELECT id FROM {User.__tablename__} WHERE id > {id_offset} AND starts_with(name, {prefix})"
+
+
+async def before_load(options: dict, id_offset: int, replace: bool, keep_indexes: bool,
+                      search_vector: bool) -> List[Tuple[str, str]]:
+    """ Проверка диапазона id (и удаление прошлой генерации) и удаление вторичных индексов статей """
+    connection = await asyncpg.connect(**options)
+    try:
+        for table in (User.__tablename__, Article.__tablename__):
+            last_id = await connection.fetchval(
+                "SELECT pg_sequence_last_value(pg_get_serial_sequence($1, 'id')::regclass)", table)
+            if last_id is not None and last_id > id_offset:
+                raise SystemExit(f"{table} id sequence is at {last_id}, past --id-offset {id_offset}")
+        users = generated_users("$1", "$2")
+        foreign = await connection.fetchval(
+            f"SELECT (SELECT count(*) FROM {User.__tablename__} WHERE id > $1 AND id NOT IN ({users})) + "
+            f"(SELECT count(*) FROM {Article.__tablename__} "
+            f" WHERE id > $1 AND (author_id IS NULL OR author_id NOT IN ({users})))",
+            id_offset, DATASET_USER_PREFIX)
+        if foreign:
+            raise SystemExit(f"{foreign} rows with id > {id_offset} were not generated, choose another --id-offset")
+        generated = await connection.fetchval(
+            f"SELECT (SELECT count(*) FROM ({users}) AS generated) + "
+            f"(SELECT count(*) FROM {Article.__tablename__} WHERE author_id IN ({users}))",
+            id_offset, DATASET_USER_PREFIX)
+        if generated and not replace:
+            raise SystemExit(f"{generated} generated rows already exist, run with --replace")
+        if generated:
+            await connection.execute(f"DELETE FROM {Article.__tablename__} WHERE author_id IN ({users})",
+                                     id_offset, DATASET_USER_PREFIX)
+            await connection.execute(f"DELETE FROM {User.__tablename__} WHERE id IN ({users})",
+                                     id_offset, DATASET_USER_PREFIX)
+        definitions = [] if keep_indexes else await secondary_indexes(connection, Article.__tablename__)
+        for name, _ in definitions:
+            await connection.execute(f'DROP INDEX "{name}"')
+        if not search_vector:
+            await connection.execute(f"ALTER TABLE {Article.__tablename__} DISABLE TRIGGER {SEARCH_TRIGGER}")
+        return definitions
+    finally:
+        await connection.close()
+
+
+async def after_load(options: dict, id_offset: int, with_checksum: bool) -> dict:
+    """ Обновление статистики; последовательности id остаются ниже сгенерированных строк """
+    connection = await asyncpg.connect(**options)
+    try:
+        for table in (User.__tablename__, Article.__tablename__):
+            await connection.execute(f"ANALYZE {table}")
+        return await checksum(connection, id_offset) if with_checksum else None
+    finally:
+        await connection.close()
+
+
+async def checksum(connection, id_offset: int) -> dict:
+    """ Не зависящая от порядка сумма хэшей сгенерированных строк (без полей, которые считает база) """
+    def query(table: str, columns: Tuple[str, ...]) -> str:
+        return (f"SELECT sum(('x' || substr(md5(concat_ws('|', {', '.join(columns)})), 1, 15))::bit(60)::bigint) "
+                f"FROM {table} WHERE id > $1")
+    return {
+        "users": str(await connection.fetchval(query(User.__tablename__, USER_COLUMNS), id_offset)),
+        "articles": str(await connection.fetchval(query(Article.__tablename__, ARTICLE_COLUMNS), id_offset)),
+    }
+
+
+def run(args):
+    options = connection_options(args.test_db)
+    timings = {}
+
+    started = time.perf_counter()
+    definitions = asyncio.run(before_load(options, args.id_offset, args.replace, args.keep_indexes,
+                                          not args.no_search_vector))
+    hashed_password = password_hash(args.seed)
+    timings["prepare"] = time.perf_counter() - started
+    try:
+        # spawn: дочерние процессы не наследуют состояние родителя
+        with ProcessPoolExecutor(args.jobs, mp_context=multiprocessing.get_context("spawn")) as executor:
+            timings["users"] = load(executor, User.__tablename__, args.users, args.chunk,
+                                    (options, args.seed, args.id_offset, hashed_password))
+            timings["articles"] = load(executor, Article.__tablename__, args.articles, args.chunk,
+                                       (options, args.seed, args.id_offset, args.users))
+    finally:
+        started = time.perf_counter()
+        asyncio.run(restore(options, definitions))
+        timings["indexes"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fingerprint = asyncio.run(after_load(options, args.id_offset, args.checksum))
+    timings["analyze"] = time.perf_counter() - started
+
+    report("dataset", {
+        "seed": args.seed,
+        "users": args.users,
+        "articles": args.articles,
+        "jobs": args.jobs,
+        "seconds": {step: round(seconds, 2) for step, seconds in {**timings, "total": sum(timings.values())}.items()},
+        "articles_per_second": round(args.articles / timings["articles"]) if args.articles else None,
+        "checksum": fingerprint,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--articles', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=4, help='число параллельных потоков COPY (процессов)')
+    parser.add_argument('--chunk', type=int, default=100000, help='строк в одной пачке COPY')
+    parser.add_argument('--id-offset', type=int, default=100000000, help='id сгенерированных строк больше него')
+    parser.add_argument('--replace', action='store_true', help='удалить ранее сгенерированные строки')
+    parser.add_argument('--keep-indexes', action='store_true', help='не перестраивать индексы статей')
+    parser.add_argument('--no-search-vector', action='store_true',
+                        help='не заполнять search_vector (в 5-10 раз быстрее, статьи не находятся поиском)')
+    parser.add_argument('--checksum', action='store_true', help='вывести контрольную сумму загруженных строк')
+    parser.add_argument('--test-db', action='store_true', help='заполнить тестовую базу вместо основной')
+    args = parser.parse_args()
+    if args.users < 1:
+        parser.error("--users must be positive")
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+""" Нагрузочный прогон API со смешанной нагрузкой.
+
+Запуск из каталога src:
+
+    python -m benchmarks.load --target asgi --workload read-heavy --duration 30 --output run.json
+    python -m benchmarks.load --target uvicorn --workers 4 --baseline run.json
+
+Перед прогоном база заполняется (benchmarks.seed) до --users/--articles.
+С --redis off приложение работает без Redis: кэши остаются только в процессе.
+Результат - JSON с пропускной способностью и p50/p95/p99 по сценариям; с
+--baseline добавляется сравнение и код выхода 1 при регрессии.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import httpx
+from sqlalchemy import text
+
+from benchmarks.common import bench_db_manager, compare, load_report, report, summarize
+from benchmarks.seed import BENCH_ARTICLE_TITLE, BENCH_PASSWORD, BENCH_USER_PREFIX, seed
+
+# Доли сценариев в каждой нагрузке
+WORKLOADS = {
+    "read-heavy": {"list": 50, "read": 45, "login": 1, "write": 4},
+    "mixed": {"list": 30, "read": 30, "login": 10, "write": 30},
+    "write-heavy": {"list": 10, "read": 10, "login": 5, "write": 75},
+    "login": {"login": 100},
+    "read-only": {"list": 50, "read": 50},
+}
+
+PER_PAGE = 20
+WRITERS = 20
+
+
+@dataclass
+class BenchContext:
+    """ Данные, из которых сценарии выбирают запросы """
+    article_ids: Tuple[int, int]
+    pages: int
+    users: int
+    # (заголовок авторизации, статьи пользователя) для записи
+    writers: List[Tuple[dict, List[dict]]] = field(default_factory=list)
+
+
+async def scenario_list(client: httpx.AsyncClient, context: BenchContext, rng: random.Random):
+    return await client.get("/articles/", params={"page": rng.randint(1, context.pages), "per_page": PER_PAGE})
+
+
+async def scenario_read(client: httpx.AsyncClient, context: BenchContext, rng: random.Random):
+    return await client.get(f"/articles/{rng.randint(*context.article_ids)}")
+
+
+async def scenario_login(client: httpx.AsyncClient, context: BenchContext, rng: random.Random):
+    username = f"{BENCH_USER_PREFIX}{rng.randrange(context.users)}"
+    return await client.post("/auth/token", json={"username": username, "password": BENCH_PASSWORD})
+
+
+async def scenario_write(client: httpx.AsyncClient, context: BenchContext, rng: random.Random):
+    headers, articles = rng.choice(context.writers)
+    article = rng.choice(articles)
+    return await client.put(f"/articles/{article['id']}", headers=headers, json={
+        "title": f"{BENCH_ARTICLE_TITLE}",
+        "content": f"updated {time.time()}",
+        "published_date": str(article["published_date"]) if article["published_date"] else None,
+        "author_id": article["author_id"],
+    })
+
+
+SCENARIOS = {
+    "list": scenario_list,
+    "read": scenario_read,
+    "login": scenario_login,
+    "write": scenario_write,
+}
+
+
+async def prepare(client: httpx.AsyncClient, users: int, articles: int, skip_seed: bool,
+                  writers: int = WRITERS) -> BenchContext:
+    """ Заполнение базы и получение токенов для сценария записи (writers пользователей) """
+    async with bench_db_manager(test_mode=False) as db_manager:
+        if not skip_seed:
+            await seed(db_manager, users, articles)
+        session = db_manager.session
+        low, high = (await session.execute(text(
+            "SELECT min(id), max(id) FROM articles WHERE title = :title"), {"title": BENCH_ARTICLE_TITLE})).one()
+        owned = (await session.execute(text(
+            "SELECT u.name, a.id, a.author_id, a.published_date FROM users u "
+            "JOIN LATERAL (SELECT id, author_id, published_date FROM articles "
+            "              WHERE author_id = u.id ORDER BY id LIMIT 20) a ON true "
+            "WHERE u.name = ANY(:names)"),
+            {"names": [f"{BENCH_USER_PREFIX}{i}" for i in range(min(writers, users))]})).mappings().all()
+    if low is None:
+        raise SystemExit("No benchmark articles found, run without --skip-seed")
+
+    context = BenchContext(article_ids=(low, high), pages=max(1, (high - low + 1) // PER_PAGE // 10), users=users)
+    by_user: Dict[str, List[dict]] = defaultdict(list)
+    for row in owned:
+        by_user[row["name"]].append(dict(row))
+    for username, user_articles in by_user.items():
+        response = await client.post("/auth/token", json={"username": username, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        context.writers.append(({"Authorization": f"Bearer {response.json()['access_token']}"}, user_articles))
+    return context
+
+
+async def client_loop(client, context, weights: Dict[str, int], rng: random.Random, deadline: float,
+                      samples: Dict[str, list], statuses: Dict[str, Counter]):
+    names, shares = zip(*weights.items())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, shares)[0]
+        started = time.perf_counter()
+        try:
+            response = await SCENARIOS[name](client, context, rng)
+            status = response.status_code
+        except httpx.HTTPError as error:
+            status = type(error).__name__
+        samples[name].append(time.perf_counter() - started)
+        statuses[name][status] += 1
+
+
+async def drive(client: httpx.AsyncClient, context: BenchContext, workload: str, concurrency: int,
+                duration: float, seed_value: int) -> dict:
+    weights = WORKLOADS[workload]
+    if not context.writers:
+        weights = {name: share for name, share in weights.items() if name != "write"}
+    samples: Dict[str, list] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        client_loop(client, context, weights, random.Random(seed_value + i), deadline, samples, statuses)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+
+    scenarios = {}
+    for name, latencies in samples.items():
+        errors = sum(count for status, count in statuses[name].items()
+                     if not isinstance(status, int) or status >= 400)
+        scenarios[name] = {
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "errors": errors,
+            "statuses": {str(status): count for status, count in statuses[name].items()},
+            **summarize(latencies),
+        }
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    scenarios["total"] = {"throughput_rps": round(len(everything) / elapsed, 1),
+                          "errors": sum(stats["errors"] for stats in scenarios.values()),
+                          **summarize(everything)}
+    return scenarios
+
+
+def start_uvicorn(port: int, workers: int, env: dict) -> subprocess.Popen:
+    """ Запуск приложения в отдельном процессе uvicorn """
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        # WEB_WORKERS нужен процессам, чтобы разделить бюджет соединений
+        env={**env, "WEB_WORKERS": str(workers)},
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30, path: str = "/ready",
+                        interval: float = 0.2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(path)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(interval)
+    raise SystemExit("uvicorn did not start")
+
+
+async def run(args) -> dict:
+    server = None
+    if args.target == "uvicorn":
+        server = start_uvicorn(args.port, args.workers, dict(os.environ))
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from main import app
+        client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=60)
+    try:
+        async with client:
+            if server is not None:
+                await wait_until_up(client)
+            context = await prepare(client, args.users, args.articles, args.skip_seed)
+            if args.warmup:
+                await drive(client, context, args.workload, args.concurrency, args.warmup, args.seed)
+            scenarios = await drive(client, context, args.workload, args.concurrency, args.duration, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return {
+        "target": args.target,
+        "workers": args.workers if server is not None else 1,
+        "workload": args.workload,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "users": args.users,
+        "articles": args.articles,
+        "redis": args.redis,
+        "scenarios": scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=['asgi', 'uvicorn'], default='asgi')
+    parser.add_argument('--workers', type=int, default=1, help='число процессов uvicorn')
+    parser.add_argument('--port', type=int, default=8990)
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='read-heavy')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=100000)
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--redis', choices=['on', 'off'], default='on')
+    parser.add_argument('--seed', type=int, default=0, help='seed генератора запросов')
+    parser.add_argument('--output', help='файл для сохранения результата')
+    parser.add_argument('--baseline', help='результат прошлого прогона для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.redis == 'off':
+        # Должно быть выставлено до импорта config (в этом процессе и в uvicorn)
+        os.environ["ARTICLE_CACHE_REDIS"] = "false"
+        os.environ["PRINCIPAL_CACHE_REDIS"] = "false"
+
+    results = asyncio.run(run(args))
+    regressions = []
+    if args.baseline:
+        results["comparison"] = compare(results["scenarios"], load_report(args.baseline)["scenarios"],
+                                        args.max_regression)
+        regressions = results["comparison"]["regressions"]
+    report("load", results, args.output)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
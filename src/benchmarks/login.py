@@ -0,0 +1,76 @@
+""" Задержка входа в зависимости от числа пользователей.
+
+Запуск из каталога src:
+
+    python -m benchmarks.login --sizes 10 1000 100000 1000000
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from auth.auth import authenticate_user
+from auth.passwords import password_hasher
+from benchmarks.common import bench_db_manager, measure, report
+from db.db_models import User
+
+BENCH_PREFIX = 'bench_login_'
+BENCH_PASSWORD = 'bench-password'
+
+
+async def seed_users(db_manager, start: int, stop: int, hashed_password: str):
+    """ Добавление пользователей с номерами [start, stop) одним запросом """
+    if start >= stop:
+        return
+    await db_manager.session.execute(
+        text(f"INSERT INTO {User.__tablename__} (email, name, hashed_password, is_active, role) "
+             "SELECT :prefix || g || '@example.com', :prefix || g, :hashed_password, true, 'user' "
+             "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer) - 1) AS g"),
+        {"prefix": BENCH_PREFIX, "hashed_password": hashed_password, "start": start, "stop": stop},
+    )
+    await db_manager.session.execute(text(f"ANALYZE {User.__tablename__}"))
+    await db_manager.session.commit()
+
+
+async def cleanup(db_manager):
+    """ Удаление пользователей, созданных бенчмарком """
+    await db_manager.session.execute(
+        text(f"DELETE FROM {User.__tablename__} WHERE name LIKE :pattern"),
+        {"pattern": BENCH_PREFIX.replace('_', '\\_') + '%'},
+    )
+    await db_manager.session.commit()
+
+
+async def run(sizes, iterations: int, login_iterations: int, test_mode: bool):
+    hashed_password = await password_hasher.hash(BENCH_PASSWORD)
+    results = []
+    async with bench_db_manager(test_mode) as db_manager:
+        await cleanup(db_manager)
+        seeded = 0
+        try:
+            for size in sorted(sizes):
+                await seed_users(db_manager, seeded, size, hashed_password)
+                seeded = max(seeded, size)
+                # Пользователь из середины диапазона, чтобы не попадать в "удачный" край таблицы
+                username = f"{BENCH_PREFIX}{size // 2}"
+                lookup = await measure(lambda: db_manager.get_user_by_username(username), iterations)
+                login = await measure(lambda: authenticate_user(username, BENCH_PASSWORD, db_manager),
+                                      login_iterations, warmup=1)
+                results.append({"users": size, "lookup": lookup, "login": login})
+        finally:
+            await cleanup(db_manager)
+    report("login", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000, 1000000])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--login-iterations', type=int, default=20)
+    parser.add_argument('--main-db', action='store_true', help='использовать основную базу вместо тестовой')
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.iterations, args.login_iterations, not args.main_db))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""" Задержка страницы GET /articles в зависимости от глубины: OFFSET против курсора.
+
+Запуск из каталога src:
+
+    python -m benchmarks.pagination --rows 2000000 --depths 1 100 10000 100000
+
+Статьи создаются от имени пользователя --author-id и удаляются после замера
+(если не указан --keep).
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from benchmarks.common import bench_db_manager, measure, report
+from db.db import DatabaseManager
+from db.db_models import Article
+
+BENCH_TITLE = 'bench_pagination'
+
+
+async def seed_articles(db_manager, rows: int, author_id: int, batch: int = 500000):
+    """ Добавление статей пачками через generate_series """
+    existing = (await db_manager.session.execute(
+        text(f"SELECT count(*) FROM {Article.__tablename__} WHERE title = :title"), {"title": BENCH_TITLE}
+    )).scalar()
+    for start in range(existing, rows, batch):
+        await db_manager.session.execute(
+            text(f"INSERT INTO {Article.__tablename__} (title, content, published_date, author_id) "
+                 "SELECT :title, repeat('x', 200), DATE '2020-01-01' + (g % 1500), :author_id "
+                 "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer) - 1) AS g"),
+            {"title": BENCH_TITLE, "author_id": author_id, "start": start, "stop": min(rows, start + batch)},
+        )
+        await db_manager.session.commit()
+    await db_manager.session.execute(text(f"ANALYZE {Article.__tablename__}"))
+    await db_manager.session.commit()
+
+
+async def cleanup(db_manager):
+    await db_manager.session.execute(
+        text(f"DELETE FROM {Article.__tablename__} WHERE title = :title"), {"title": BENCH_TITLE}
+    )
+    await db_manager.session.commit()
+
+
+async def id_at_offset(db_manager, offset: int):
+    """ id статьи, после которой начинается страница с данным смещением """
+    if offset == 0:
+        return None
+    return (await db_manager.session.execute(
+        text(f"SELECT id FROM {Article.__tablename__} ORDER BY id OFFSET :offset LIMIT 1"),
+        {"offset": offset - 1},
+    )).scalar()
+
+
+async def run(rows: int, depths, per_page: int, iterations: int, author_id: int, keep: bool, test_mode: bool):
+    # Замеряется сам запрос, без кэша чтения
+    get_articles = DatabaseManager.get_articles.__wrapped__
+    results = []
+    async with bench_db_manager(test_mode) as db_manager:
+        await seed_articles(db_manager, rows, author_id)
+        try:
+            for depth in depths:
+                offset = (depth - 1) * per_page
+                after_id = await id_at_offset(db_manager, offset)
+                results.append({
+                    "page": depth,
+                    "offset": await measure(lambda: get_articles(db_manager, depth, per_page), iterations),
+                    "cursor": await measure(lambda: get_articles(db_manager, 1, per_page, None, None, after_id),
+                                            iterations),
+                })
+        finally:
+            if not keep:
+                await cleanup(db_manager)
+    report("pagination", {"rows": rows, "per_page": per_page, "pages": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--author-id', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help='не удалять созданные статьи')
+    parser.add_argument('--main-db', action='store_true', help='использовать основную базу вместо тестовой')
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.depths, args.per_page, args.iterations, args.author_id,
+                    args.keep, not args.main_db))
+
+
+if __name__ == '__main__':
+    main()
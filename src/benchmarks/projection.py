@@ -0,0 +1,55 @@
+""" Страница GET /articles в разных представлениях (view=full|summary|excerpt): размер и время.
+
+Запуск из каталога src:
+
+    python -m benchmarks.projection --articles 100000 --per-page 200
+
+Для каждого представления замеряется запрос к базе без кэша и размер
+ответа API. База заполняется benchmarks.seed (текст статьи - 240-2600 символов).
+"""
+import argparse
+import asyncio
+
+import httpx
+
+from benchmarks.common import bench_db_manager, measure, report
+from benchmarks.seed import seed
+from db.db import DatabaseManager, VIEW_COLUMNS
+
+
+async def response_bytes(view: str, per_page: int) -> int:
+    """ Размер тела ответа GET /articles для представления """
+    from main import app
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        response = await client.get("/articles/", params={"view": view, "per_page": per_page})
+        response.raise_for_status()
+        return len(response.content)
+
+
+async def run(users: int, articles: int, per_page: int, iterations: int, test_mode: bool):
+    get_articles = DatabaseManager.get_articles.__wrapped__
+    results = {}
+    async with bench_db_manager(test_mode) as db_manager:
+        await seed(db_manager, users, articles)
+        for view in VIEW_COLUMNS:
+            results[view] = {
+                "query": await measure(lambda: get_articles(db_manager, 1, per_page, None, None, None, view),
+                                       iterations),
+                "response_bytes": await response_bytes(view, per_page) if not test_mode else None,
+            }
+    report("projection", {"per_page": per_page, "views": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=100000)
+    parser.add_argument('--per-page', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--test-db', action='store_true', help='использовать тестовую базу (без замера ответа API)')
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.articles, args.per_page, args.iterations, args.test_db))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+""" Масштабирование по процессам: пропускная способность uvicorn с 1, 2, 4... воркерами при общем бюджете соединений.
+
+Запуск из каталога src против основной базы и Redis:
+
+    python -m benchmarks.scaling --workers 1 2 4 8 --budget 40 --duration 30
+
+Для каждого числа воркеров запускается новый процесс uvicorn с WEB_WORKERS и
+DB_CONNECTION_BUDGET, после --warmup секунд нагрузки замеряются пропускная
+способность и p50/p95/p99 за --duration секунд. Во время замера раз в
+--sample-interval секунд считаются соединения с базой, открытые сервером
+(сверх тех, что были до его запуска): их максимум не должен превышать бюджет.
+Клиент нагрузки - один процесс; он сам занимает ядро, поэтому при числе
+воркеров, равном числу ядер, рост упирается в него.
+"""
+import argparse
+import asyncio
+import os
+
+import httpx
+from sqlalchemy import text
+
+from benchmarks.common import bench_db_manager, report
+from benchmarks.load import drive, prepare, start_uvicorn, wait_until_up
+from benchmarks.seed import seed
+
+CONNECTIONS_QUERY = text(
+    "SELECT count(*) FROM pg_stat_activity "
+    "WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()"
+)
+
+
+async def count_connections(db_manager) -> int:
+    count = await db_manager.session.scalar(CONNECTIONS_QUERY)
+    # pg_stat_activity не меняется до конца транзакции
+    await db_manager.session.commit()
+    return count
+
+
+async def sample_connections(db_manager, baseline: int, interval: float, peak: list):
+    while True:
+        peak[0] = max(peak[0], await count_connections(db_manager) - baseline)
+        await asyncio.sleep(interval)
+
+
+async def measure_workers(args, db_manager, workers: int) -> dict:
+    env = {**os.environ, "DB_CONNECTION_BUDGET": str(args.budget)}
+    baseline = await count_connections(db_manager)
+    server = start_uvicorn(args.port, workers, env)
+    client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60,
+                               limits=httpx.Limits(max_connections=args.concurrency))
+    peak = [0]
+    try:
+        async with client:
+            await wait_until_up(client, timeout=60)
+            context = await prepare(client, args.users, args.articles, skip_seed=True)
+            if args.warmup:
+                await drive(client, context, args.workload, args.concurrency, args.warmup, args.seed)
+            sampler = asyncio.ensure_future(sample_connections(db_manager, baseline, args.sample_interval, peak))
+            try:
+                scenarios = await drive(client, context, args.workload, args.concurrency, args.duration,
+                                        args.seed)
+            finally:
+                sampler.cancel()
+                await asyncio.gather(sampler, return_exceptions=True)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"workers": workers, "db_connections_peak": peak[0], **scenarios["total"]}
+
+
+async def run(args):
+    async with bench_db_manager(test_mode=False) as db_manager:
+        await seed(db_manager, args.users, args.articles)
+        runs = [await measure_workers(args, db_manager, workers) for workers in args.workers]
+    single = runs[0]["throughput_rps"]
+    for result in runs:
+        result["speedup"] = round(result["throughput_rps"] / single, 2) if single else None
+    report("scaling", {"cpu_count": os.cpu_count(), "budget": args.budget, "workload": args.workload,
+                       "concurrency": args.concurrency, "duration": args.duration, "runs": runs}, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}), help='число процессов uvicorn')
+    parser.add_argument('--budget', type=int, default=40, help='DB_CONNECTION_BUDGET на все воркеры')
+    parser.add_argument('--port', type=int, default=8992)
+    parser.add_argument('--workload', choices=['read-heavy', 'mixed', 'write-heavy', 'read-only'],
+                        default='read-heavy')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--sample-interval', type=float, default=0.5)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0, help='seed генератора запросов')
+    parser.add_argument('--output', help='файл для сохранения результата')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+""" Задержка полнотекстового поиска по статьям в зависимости от частоты слова.
+
+Запуск из каталога src:
+
+    python -m benchmarks.search --articles 2000000
+
+База заполняется benchmarks.seed; в каждой статье есть одно из BENCH_WORDS
+(1/10 статей) и topic<n> (1/1000 статей), а 'lorem' встречается везде.
+Замеряется первая страница и страница --depth (по курсору) без кэша, а
+также повторный запрос через кэш чтения.
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import bench_db_manager, measure, report
+from benchmarks.seed import BENCH_WORDS, seed
+from db.db import DatabaseManager
+
+QUERIES = {
+    "rare": "topic42",
+    "selective": f"{BENCH_WORDS[0]} topic42",
+    "common": BENCH_WORDS[1],
+    "phrase": f'"{BENCH_WORDS[2]} topic7"',
+    "everywhere": "lorem",
+}
+
+
+async def page_after(search, db_manager, query: str, per_page: int, depth: int):
+    """ Курсор (rank, id) перед страницей depth """
+    after_rank = after_id = None
+    for _ in range(depth - 1):
+        results = await search(db_manager, query, per_page, after_rank, after_id)
+        if len(results) < per_page:
+            break
+        after_rank, after_id = results[-1]["rank"], results[-1]["id"]
+    return after_rank, after_id
+
+
+async def run(users: int, articles: int, per_page: int, depth: int, iterations: int, test_mode: bool):
+    # Запрос к базе без кэша и полный путь с кэшем чтения
+    search = DatabaseManager.search_articles.__wrapped__
+    results = {}
+    async with bench_db_manager(test_mode) as db_manager:
+        await seed(db_manager, users, articles)
+        for name, query in QUERIES.items():
+            after_rank, after_id = await page_after(search, db_manager, query, per_page, depth)
+            results[name] = {
+                "query": query,
+                "first_page": await measure(lambda: search(db_manager, query, per_page), iterations),
+                f"page_{depth}": await measure(lambda: search(db_manager, query, per_page, after_rank, after_id),
+                                               iterations),
+                "cached": await measure(lambda: db_manager.search_articles(query, per_page), iterations),
+            }
+    report("search", {"articles": articles, "per_page": per_page, "queries": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=2000000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--test-db', action='store_true', help='использовать тестовую базу вместо основной')
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.articles, args.per_page, args.depth, args.iterations, args.test_db))
+
+
+if __name__ == '__main__':
+    main()
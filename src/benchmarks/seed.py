@@ -0,0 +1,84 @@
+""" Заполнение базы пользователями и статьями для бенчмарков.
+
+Запуск из каталога src:
+
+    python -m benchmarks.seed --users 1000 --articles 100000
+
+Пользователи bench_user_<n> получают пароль BENCH_PASSWORD. Повторный запуск
+досоздает недостающие строки.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from auth.passwords import password_hasher
+from benchmarks.common import bench_db_manager
+from db.db_models import Article, User
+
+BENCH_USER_PREFIX = 'bench_user_'
+BENCH_ARTICLE_TITLE = 'bench_article'
+BENCH_PASSWORD = 'bench-password'
+# Слова для полнотекстового поиска: каждое встречается в 1/len статей, topic<n> - в 1/1000
+BENCH_WORDS = ['database', 'performance', 'caching', 'python', 'postgres',
+               'latency', 'throughput', 'index', 'search', 'replication']
+
+
+async def count_rows(db_manager, query: str, params: dict) -> int:
+    return (await db_manager.session.execute(text(query), params)).scalar()
+
+
+async def seed(db_manager, users: int, articles: int, batch: int = 200000):
+    """ Досоздание пользователей и статей до заданного количества """
+    existing_users = await count_rows(
+        db_manager, f"SELECT count(*) FROM {User.__tablename__} WHERE name LIKE :pattern",
+        {"pattern": BENCH_USER_PREFIX.replace('_', '\\_') + '%'})
+    if existing_users < users:
+        # Хэш один на всех: bcrypt для каждого пользователя занял бы часы
+        hashed_password = await password_hasher.hash(BENCH_PASSWORD)
+        await db_manager.session.execute(
+            text(f"INSERT INTO {User.__tablename__} (email, name, hashed_password, is_active, role) "
+                 "SELECT :prefix || g || '@example.com', :prefix || g, :hashed_password, true, 'user' "
+                 "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer) - 1) AS g"),
+            {"prefix": BENCH_USER_PREFIX, "hashed_password": hashed_password,
+             "start": existing_users, "stop": users},
+        )
+        await db_manager.session.commit()
+
+    existing_articles = await count_rows(
+        db_manager, f"SELECT count(*) FROM {Article.__tablename__} WHERE title = :title",
+        {"title": BENCH_ARTICLE_TITLE})
+    for start in range(existing_articles, articles, batch):
+        await db_manager.session.execute(
+            text(f"INSERT INTO {Article.__tablename__} (title, content, published_date, author_id) "
+                 "SELECT :title, repeat('Lorem ipsum ', 20 + g % 200) "
+                 "|| ' ' || (CAST(:words AS text[]))[g % :word_count + 1] || ' topic' || (g % 1000), "
+                 "DATE '2020-01-01' + (g % 1500), u.id "
+                 "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer) - 1) AS g "
+                 f"JOIN {User.__tablename__} u ON u.name = :prefix || (g % :users)"),
+            {"title": BENCH_ARTICLE_TITLE, "prefix": BENCH_USER_PREFIX, "users": users,
+             "words": BENCH_WORDS, "word_count": len(BENCH_WORDS),
+             "start": start, "stop": min(articles, start + batch)},
+        )
+        await db_manager.session.commit()
+    await db_manager.session.execute(text(f"ANALYZE {User.__tablename__}"))
+    await db_manager.session.execute(text(f"ANALYZE {Article.__tablename__}"))
+    await db_manager.session.commit()
+
+
+async def run(users: int, articles: int, test_mode: bool):
+    async with bench_db_manager(test_mode) as db_manager:
+        await seed(db_manager, users, articles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=100000)
+    parser.add_argument('--test-db', action='store_true', help='заполнить тестовую базу вместо основной')
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.articles, args.test_db))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+""" Сериализация страницы статей: response_model FastAPI против orjson (FAST_JSON_RESPONSES).
+
+Запуск из каталога src (база не нужна):
+
+    python -m benchmarks.serialization --rows 10 200 10000
+"""
+import argparse
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from articles.responses import fast_json_response
+from benchmarks.common import measure, report
+from main import app
+
+
+def make_articles(rows: int) -> list:
+    """ Статьи в том виде, в каком их возвращает DatabaseManager """
+    updated_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": i,
+            "title": f"Article {i}",
+            "content": "Lorem ipsum dolor sit amet. " * 20,
+            "published_date": date(2024, 1, 1) + timedelta(days=i % 365),
+            "author_id": i % 100,
+            "version": 1,
+            "updated_at": updated_at,
+        }
+        for i in range(rows)
+    ]
+
+
+def list_route_field():
+    for route in app.routes:
+        if getattr(route, "path", None) == "/articles/" and "GET" in route.methods:
+            return route.response_field
+    raise LookupError("GET /articles/ route not found")
+
+
+async def run(sizes, iterations: int):
+    field = list_route_field()
+    results = []
+    for rows in sizes:
+        articles = make_articles(rows)
+
+        async def current_path():
+            content = await serialize_response(field=field, response_content=articles)
+            return JSONResponse(content).body
+
+        async def fast_path():
+            return fast_json_response(articles, Response()).body
+
+        assert json.loads(await current_path()) == json.loads(await fast_path())
+        repeat = max(3, iterations * 200 // max(rows, 200))
+        results.append({
+            "rows": rows,
+            "response_model": await measure(current_path, repeat),
+            "orjson": await measure(fast_path, repeat),
+        })
+    report("serialization", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 200, 10000])
+    parser.add_argument('--iterations', type=int, default=200, help='число повторов для страницы из 200 строк')
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
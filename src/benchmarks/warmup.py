@@ -0,0 +1,84 @@
+""" Старт приложения с прогревом и без: время до первого ответа и задержки первой минуты.
+
+Запуск из каталога src против основной базы:
+
+    python -m benchmarks.warmup --duration 60 --preload-pages 20
+
+Для каждого режима запускается новый процесс uvicorn (Redis выключен, чтобы
+кэш прошлого прогона не влиял на результат). Замеряется время от запуска
+процесса до ответа /ready, задержка первого запроса после этого и p50/p95/p99
+нагрузки read-only (без bcrypt, который не прогревается) сразу после готовности:
+отдельно первые --window секунд и оставшаяся часть --duration.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.common import bench_db_manager, report
+from benchmarks.load import drive, prepare, start_uvicorn, wait_until_up
+from benchmarks.seed import seed
+
+
+async def start(args, warmup: bool) -> dict:
+    env = {**os.environ, "WARMUP_ENABLED": "true" if warmup else "false",
+           "WARMUP_PRELOAD_PAGES": str(args.preload_pages), "ARTICLE_CACHE_REDIS": "false",
+           "PRINCIPAL_CACHE_REDIS": "false"}
+    started = time.perf_counter()
+    server = start_uvicorn(args.port, 1, env)
+    client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60,
+                               limits=httpx.Limits(max_connections=args.concurrency))
+    try:
+        async with client:
+            await wait_until_up(client, path="/ready", interval=0.01)
+            ready = time.perf_counter() - started
+            request_started = time.perf_counter()
+            (await client.get("/articles/")).raise_for_status()
+            first_request = time.perf_counter() - request_started
+            context = await prepare(client, args.users, args.articles, skip_seed=True, writers=0)
+            first = await drive(client, context, "read-only", args.concurrency, args.window, args.seed)
+            rest = await drive(client, context, "read-only", args.concurrency, args.duration - args.window,
+                               args.seed + args.concurrency)
+            timings = (await client.get("/ready")).json()["timings"]
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "ready_s": round(ready, 3),
+        "first_request_ms": round(first_request * 1000, 3),
+        "time_to_first_response_s": round(ready + first_request, 3),
+        "warmup_timings": timings,
+        f"first_{args.window:g}s": first["total"],
+        "rest": rest["total"],
+    }
+
+
+async def run(args):
+    async with bench_db_manager(test_mode=False) as db_manager:
+        await seed(db_manager, args.users, args.articles)
+    results = {"duration": args.duration, "window": args.window, "concurrency": args.concurrency,
+               "preload_pages": args.preload_pages}
+    for mode in ("cold", "warm"):
+        results[mode] = await start(args, warmup=mode == "warm")
+    report("warmup", results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8991)
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--window', type=float, default=5.0, help='первые секунды, замеряемые отдельно')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--preload-pages', type=int, default=20)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--articles', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0, help='seed генератора запросов')
+    parser.add_argument('--output', help='файл для сохранения результата')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+""" Вставка статей по одной (COMMIT на статью) и через очередь отложенной записи.
+
+Запуск из каталога src против основной базы:
+
+    python -m benchmarks.write_behind --concurrency 64 --duration 10
+
+Каждый из --concurrency клиентов в цикле создает статью и ждет ее id, как
+обработчик POST /articles/. Для отложенной записи дополнительно выводится
+распределение размеров пачек. Созданные статьи удаляются после прогона.
+"""
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+
+from sqlalchemy import text
+
+from benchmarks.common import bench_db_manager, report, summarize
+from benchmarks.seed import BENCH_USER_PREFIX, seed
+from db.db import DatabaseManager
+from db.db_models import Article, User
+from metrics.metrics import WRITE_BATCH_ROWS
+
+WRITE_TITLE = 'bench_write_behind'
+
+
+async def drive(create: Callable[[dict], Awaitable], author_ids: List[int], concurrency: int,
+                duration: float) -> dict:
+    samples = []
+    deadline = time.perf_counter() + duration
+
+    async def client(index: int):
+        author_id = author_ids[index % len(author_ids)]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await create({"title": WRITE_TITLE, "content": "content", "author_id": author_id,
+                          "published_date": None})
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    return {"throughput_rps": round(len(samples) / (time.perf_counter() - started), 1), **summarize(samples)}
+
+
+def batch_sizes() -> dict:
+    """ Число пачек и средний размер пачки по гистограмме db_write_batch_rows """
+    values = {sample.name: sample.value for metric in WRITE_BATCH_ROWS.collect() for sample in metric.samples}
+    batches = values.get("db_write_batch_rows_count", 0)
+    return {"batches": int(batches), "mean_rows": round(values.get("db_write_batch_rows_sum", 0) / batches, 1)
+            if batches else 0}
+
+
+async def run(concurrency: int, duration: float, users: int):
+    async with bench_db_manager(test_mode=False) as db_manager:
+        await seed(db_manager, users, 0)
+        author_ids = list((await db_manager.session.execute(
+            text(f"SELECT id FROM {User.__tablename__} WHERE name LIKE :pattern LIMIT :users"),
+            {"pattern": BENCH_USER_PREFIX.replace('_', '\\_') + '%', "users": users})).scalars())
+
+    db_manager = DatabaseManager()
+
+    async def one_by_one(article: dict):
+        await db_manager.add_article(Article(**article))
+
+    results = {"concurrency": concurrency, "duration": duration}
+    results["commit_per_article"] = await drive(one_by_one, author_ids, concurrency, duration)
+    results["write_behind"] = await drive(db_manager.enqueue_article, author_ids, concurrency, duration)
+    await db_manager.batcher.stop()
+    results["write_behind"]["batches"] = batch_sizes()
+
+    async with bench_db_manager(test_mode=False) as cleanup:
+        await cleanup.session.execute(text(f"DELETE FROM {Article.__tablename__} WHERE title = :title"),
+                                      {"title": WRITE_TITLE})
+        await cleanup.session.commit()
+    report("write_behind", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.duration, args.users))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+""" Алгоритмы сжатия ответов: gzip всегда, br и zstd - если установлены brotli и zstandard """
+import gzip
+import zlib
+from typing import Dict, List, Optional
+
+from config import COMPRESSION_BROTLI_QUALITY, COMPRESSION_GZIP_LEVEL, COMPRESSION_ZSTD_LEVEL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCodec:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # mtime=0: одинаковые данные дают одинаковые байты
+        return gzip.compress(data, self.level, mtime=0)
+
+    def compressobj(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class BrotliStream:
+    """ Потоковый компрессор brotli с интерфейсом zlib (compress/flush) """
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class BrotliCodec:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self.quality = quality
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.quality)
+
+    def compressobj(self):
+        return BrotliStream(self.quality)
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def compressobj(self):
+        return self._compressor.compressobj()
+
+
+def available_codecs(names: List[str]) -> Dict[str, object]:
+    """ Алгоритмы из names, для которых установлены библиотеки, в том же порядке """
+    factories = {"gzip": lambda: GzipCodec(COMPRESSION_GZIP_LEVEL)}
+    if brotli is not None:
+        factories["br"] = lambda: BrotliCodec(COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        factories["zstd"] = lambda: ZstdCodec(COMPRESSION_ZSTD_LEVEL)
+    return {name: factories[name]() for name in names if name in factories}
+
+
+def negotiate(accept_encoding: str, codecs: Dict[str, object]) -> Optional[str]:
+    """ Выбор алгоритма по Accept-Encoding: первый в порядке сервера с ненулевым q """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if name:
+            accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0)
+    for name in codecs:
+        if accepted.get(name, wildcard) > 0:
+            return name
+    return None
@@ -0,0 +1,152 @@
+import hashlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from compression.codecs import available_codecs, negotiate
+from config import COMPRESSION_CACHE_SIZE, COMPRESSION_ENCODINGS, COMPRESSION_MIN_SIZE
+from metrics.metrics import register_cache
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Ключ в request.state: тело ответа повторится, пока действительна запись кэша чтения
+PRECOMPRESS = "precompress"
+
+
+def precompress(request: Request):
+    """ Пометка ответа из кэша чтения: сжатые байты сохраняются и переиспользуются """
+    setattr(request.state, PRECOMPRESS, True)
+
+
+class CompressedBodies:
+    """ LRU сжатых тел ответов по версии содержимого.
+
+    Версия - путь и строгий ETag ответа (id и version статей), а без ETag -
+    хэш исходных байтов. Поэтому инвалидация не нужна: новое значение в кэше
+    чтения дает новый ключ, а старые записи вытесняются.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.stats = Counter()
+        self._bodies: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def get_or_compress(self, codec, body: bytes, version: Optional[str] = None) -> bytes:
+        key = (codec.name, version or hashlib.sha256(body).hexdigest())
+        compressed = self._bodies.get(key)
+        if compressed is not None:
+            self.stats['hits_local'] += 1
+            self._bodies.move_to_end(key)
+            return compressed
+        self.stats['misses'] += 1
+        compressed = self._bodies[key] = codec.compress(body)
+        while len(self._bodies) > self.size:
+            self._bodies.popitem(last=False)
+        return compressed
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {"compressed_bodies": dict(self.stats)}
+
+
+compressed_bodies = CompressedBodies(COMPRESSION_CACHE_SIZE)
+register_cache("compression", compressed_bodies.snapshot)
+
+
+class CompressionMiddleware:
+    """ Сжатие ответов по Accept-Encoding.
+
+    Ответы меньше minimum_size и уже сжатые не трогаются. Потоковые ответы
+    (выгрузка) сжимаются по частям. Тела ответов, помеченных precompress(),
+    сжимаются один раз и берутся из compressed_bodies. Строгий ETag сжатого
+    ответа становится слабым: строгий валидатор должен различаться для разных
+    Content-Encoding, а If-None-Match сравнивает ETag без учета W/.
+    """
+    def __init__(self, app: ASGIApp, encodings: List[str] = COMPRESSION_ENCODINGS,
+                 minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.codecs = available_codecs(encodings)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = None
+        if scope["type"] == "http" and self.codecs:
+            encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressingResponder(scope, send, self.codecs[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressingResponder:
+    """ Обертка send для одного ответа """
+    def __init__(self, scope: Scope, send: Send, codec, minimum_size: int):
+        self.scope = scope
+        self._send = send
+        self.codec = codec
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+        if self.compressor is not None:
+            body = self.compressor.compress(message.get("body", b""))
+            if not message.get("more_body", False):
+                body += self.compressor.flush()
+            await self._send({**message, "body": body})
+            return
+
+        # Первая часть тела: решаем, сжимать ли ответ
+        headers = MutableHeaders(raw=self.start["headers"])
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.start["status"] == 304:
+            self._weaken_not_modified(headers)
+        if not self._compressible(headers):
+            self.passthrough = True
+            await self._send(self.start)
+            await self._send(message)
+            return
+        headers.add_vary_header("Accept-Encoding")
+        if not more_body and len(body) < self.minimum_size:
+            self.passthrough = True
+            await self._send(self.start)
+            await self._send(message)
+            return
+
+        headers["Content-Encoding"] = self.codec.name
+        etag = headers.get("etag", "")
+        if etag.startswith('"'):
+            headers["ETag"] = f"W/{etag}"
+        if more_body:
+            del headers["Content-Length"]
+            self.compressor = self.codec.compressobj()
+            body = self.compressor.compress(body)
+        elif self.scope.get("state", {}).get(PRECOMPRESS):
+            version = f"{self.scope['path']} {etag}" if etag.startswith('"') else None
+            body = compressed_bodies.get_or_compress(self.codec, body, version)
+        else:
+            body = self.codec.compress(body)
+        if not more_body:
+            headers["Content-Length"] = str(len(body))
+        await self._send(self.start)
+        await self._send({**message, "body": body})
+
+    def _weaken_not_modified(self, headers: MutableHeaders):
+        """ 304 повторяет ETag в том виде, в каком его получил клиент (слабый - от сжатого ответа) """
+        etag = headers.get("etag", "")
+        if_none_match = Headers(scope=self.scope).get("if-none-match", "")
+        if etag.startswith('"') and f"W/{etag}" in {tag.strip() for tag in if_none_match.split(",")}:
+            headers["ETag"] = f"W/{etag}"
+
+    def _compressible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers or self.start["status"] < 200 or self.start["status"] in (204, 304):
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
@@ -14,11 +14,82 @@ FOREIGN_KEY_U = os.environ.get("FOREIGN_KEY_U")
 REDIS_HOST = os.environ.get("REDIS_HOST")
 REDIS_PORT = os.environ.get("REDIS_PORT")
 
+ARTICLE_CACHE_TTL = int(os.environ.get("ARTICLE_CACHE_TTL", 60))
+ARTICLE_CACHE_LOCAL_TTL = int(os.environ.get("ARTICLE_CACHE_LOCAL_TTL", 5))
+ARTICLE_CACHE_STALE_TTL = int(os.environ.get("ARTICLE_CACHE_STALE_TTL", 30))
+ARTICLE_CACHE_LOCAL_SIZE = int(os.environ.get("ARTICLE_CACHE_LOCAL_SIZE", 1000))
+ARTICLE_CACHE_REDIS = os.environ.get("ARTICLE_CACHE_REDIS", "true" if REDIS_HOST else "false").lower() in ("1", "true", "yes")
+
+FAST_JSON_RESPONSES = os.environ.get("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+ARTICLES_BULK_MAX = int(os.environ.get("ARTICLES_BULK_MAX", 1000))
+ARTICLES_EXPORT_CHUNK = int(os.environ.get("ARTICLES_EXPORT_CHUNK", 1000))
+ARTICLES_EXCERPT_LENGTH = int(os.environ.get("ARTICLES_EXCERPT_LENGTH", 200))
+# Отложенная запись: POST /articles/ кладет статью в очередь, а фоновая задача вставляет
+# пачку одной транзакцией (до ARTICLES_BATCH_SIZE статей или через ARTICLES_BATCH_WAIT_MS)
+ARTICLES_WRITE_BEHIND = os.environ.get("ARTICLES_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ARTICLES_BATCH_SIZE = int(os.environ.get("ARTICLES_BATCH_SIZE", 200))
+ARTICLES_BATCH_WAIT_MS = float(os.environ.get("ARTICLES_BATCH_WAIT_MS", 5))
+ARTICLES_QUEUE_SIZE = int(os.environ.get("ARTICLES_QUEUE_SIZE", 2000))
+# Сколько секунд ждать места в заполненной очереди, прежде чем ответить 503
+ARTICLES_QUEUE_TIMEOUT = float(os.environ.get("ARTICLES_QUEUE_TIMEOUT", 1))
+
+# Процессы uvicorn при запуске через serve.py; ядра и бюджет соединений делятся между ними
+WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.environ.get("WEB_PORT", 90))
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 1))
+
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 32))
+
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = int(os.environ.get("PRINCIPAL_CACHE_TTL", 60))
+PRINCIPAL_CACHE_REDIS = os.environ.get("PRINCIPAL_CACHE_REDIS", "false").lower() in ("1", "true", "yes")
+# Рассылка сброса пользователя другим процессам через Redis (и без уровня кэша в Redis);
+# по умолчанию включена, если процессов несколько
+PRINCIPAL_CACHE_BROADCAST = os.environ.get(
+    "PRINCIPAL_CACHE_BROADCAST", "true" if REDIS_HOST and WEB_WORKERS > 1 else "false",
+).lower() in ("1", "true", "yes")
+
+# Порядок - предпочтение сервера; br и zstd используются, если установлены brotli и zstandard
+COMPRESSION_ENCODINGS = [name.strip() for name in os.environ.get("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(",")
+                         if name.strip()]
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 5))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+COMPRESSION_CACHE_SIZE = int(os.environ.get("COMPRESSION_CACHE_SIZE", 1000))
+
 DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
 
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Сколько соединений с каждым сервером базы открывают все WEB_WORKERS процессов вместе
+# (0 - без ограничения): пул процесса уменьшается до своей доли, сохраняя соотношение
+# DB_POOL_SIZE и DB_MAX_OVERFLOW
+DB_CONNECTION_BUDGET = int(os.environ.get("DB_CONNECTION_BUDGET", 0))
+
+# Реплики для чтения: host[:port][/dbname] через запятую; пользователь и пароль как у основной базы
+DB_REPLICAS = [replica.strip() for replica in os.environ.get("DB_REPLICAS", "").split(",") if replica.strip()]
+DB_REPLICA_SELECTION = os.environ.get("DB_REPLICA_SELECTION", "round_robin")
+DB_REPLICA_POOL_SIZE = int(os.environ.get("DB_REPLICA_POOL_SIZE", DB_POOL_SIZE))
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_HEALTH_INTERVAL = float(os.environ.get("DB_REPLICA_HEALTH_INTERVAL", 2))
+# Сколько секунд после записи чтение клиента идет в основную базу
+DB_READ_YOUR_WRITES_WINDOW = float(os.environ.get("DB_READ_YOUR_WRITES_WINDOW", 10))
+
+# Прогрев при старте: соединения пула, подготовленные запросы и первые страницы
+# списка статей; пока он идет, GET /ready отвечает 503
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", DB_POOL_SIZE))
+WARMUP_PRELOAD_PAGES = int(os.environ.get("WARMUP_PRELOAD_PAGES", 0))
+WARMUP_RETRY_INTERVAL = float(os.environ.get("WARMUP_RETRY_INTERVAL", 1))
+
 TEST_USERNAME = os.environ.get("TEST_USERNAME")
 TEST_PASSWORD = os.environ.get("TEST_PASSWORD")
\ No newline at end of file
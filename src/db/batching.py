@@ -0,0 +1,118 @@
+""" Отложенная запись статей: очередь и вставка пачками с общим COMMIT """
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import exc
+
+from metrics.metrics import WRITE_BATCH_ROWS, WRITE_QUEUE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Сигнал фоновой задаче: записать накопленное и завершиться
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """ Очередь отложенной записи заполнена дольше допустимого ожидания """
+
+
+class ArticleBatcher:
+    """ Очередь статей, которые фоновая задача вставляет пачками.
+
+    Пачка набирается, пока в ней меньше batch_size статей и с прихода первой
+    прошло меньше max_wait секунд, и записывается одним INSERT в одной
+    транзакции (flush). Вызывающий получает созданную статью с id после
+    COMMIT. Если очередь заполнена дольше put_timeout секунд, submit
+    выбрасывает WriteQueueFull.
+    """
+    def __init__(self, flush: Callable[[List[dict]], Awaitable[List[dict]]], batch_size: int, max_wait: float,
+                 queue_size: int, put_timeout: float):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue_size = queue_size
+        self.put_timeout = put_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(self, article: dict) -> dict:
+        """ Постановка статьи в очередь; возвращает ее после записи пачки """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop, self._queue = loop, asyncio.Queue(self.queue_size)
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        try:
+            await asyncio.wait_for(self._queue.put((article, future)), self.put_timeout)
+        except asyncio.TimeoutError:
+            WRITE_QUEUE_REJECTED.inc()
+            raise WriteQueueFull()
+        return await future
+
+    async def stop(self):
+        """ Запись всего, что осталось в очереди, и остановка фоновой задачи """
+        if self._task is None or self._task.done() or self._loop is not asyncio.get_running_loop():
+            self._task = None
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch, stopping = [item], False
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch: List[Tuple[dict, asyncio.Future]]):
+        WRITE_BATCH_ROWS.observe(len(batch))
+        try:
+            created = await self.flush([article for article, _ in batch])
+        except exc.IntegrityError as error:
+            if len(batch) == 1:
+                _resolve(batch, error=error)
+                return
+            # Одна ошибочная статья не должна отменять всю пачку: остальные пишутся по одной
+            logger.warning("Write-behind batch of %s failed, retrying one by one: %r", len(batch), error)
+            for item in batch:
+                await self._write([item])
+            return
+        except Exception as error:
+            _resolve(batch, error=error)
+            return
+        _resolve(batch, created)
+
+
+def _resolve(batch: List[Tuple[dict, asyncio.Future]], created: Optional[List[dict]] = None,
+             error: Optional[BaseException] = None):
+    """ Результат каждому вызывающему (его запрос мог быть уже отменен) """
+    for index, (_, future) in enumerate(batch):
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(created[index])
@@ -0,0 +1,293 @@
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from aiocache import Cache
+from aiocache.serializers import BaseSerializer
+
+from metrics.metrics import register_cache
+from config import (REDIS_HOST, REDIS_PORT, ARTICLE_CACHE_TTL, ARTICLE_CACHE_LOCAL_TTL,
+                    ARTICLE_CACHE_LOCAL_SIZE, ARTICLE_CACHE_REDIS, ARTICLE_CACHE_STALE_TTL)
+
+logger = logging.getLogger(__name__)
+
+FRESH = 'fresh'
+STALE = 'stale'
+MISSING = object()
+
+
+class OrjsonSerializer(BaseSerializer):
+    """ Сериализация в JSON через orjson: быстрее pickle и не исполняет код при чтении """
+    DEFAULT_ENCODING = None
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        return orjson.loads(value)
+
+
+class InvalidationChannel:
+    """ Канал Redis, через который процессы приложения (воркеры) сообщают друг другу об инвалидации.
+
+    Подписанный процесс сразу сбрасывает свои записи в памяти, не дожидаясь их
+    ttl. Сообщения, отправленные, пока подписка потеряна (Redis недоступен), не
+    доходят: тогда запись в памяти живет до своего ttl, как и без канала.
+    """
+    def __init__(self, redis: Cache, name: str, handler: Callable[[Any], None], retry_interval: float = 1):
+        self.redis = redis
+        self.name = name
+        self.handler = handler
+        self.retry_interval = retry_interval
+        self.stats = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, message: Any):
+        await self.redis.client.publish(self.name, orjson.dumps(message))
+        self.stats['published'] += 1
+
+    def start(self):
+        """ Подписка на канал в фоне """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            pubsub = self.redis.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.name)
+                async for message in pubsub.listen():
+                    self.handler(orjson.loads(message['data']))
+                    self.stats['received'] += 1
+            except Exception:
+                logger.warning("Invalidation channel %s: Redis is unavailable", self.name, exc_info=True)
+                self.stats['errors'] += 1
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(self.retry_interval)
+
+
+class TaggedCache:
+    """ Двухуровневый кэш чтения: L1 в памяти процесса, L2 в общем Redis.
+
+    Каждая запись помечена тегами (например, article:1, author:2, date:2024-01-01).
+    Запись действительна, пока версии ее тегов не изменились; запись в базу
+    увеличивает версии затронутых тегов. Версии читаются вместе с записью одним
+    запросом к Redis и запоминаются до обращения к базе, поэтому значение,
+    прочитанное до конкурентной записи, не переживет ее инвалидацию.
+
+    Одновременные промахи по одному ключу объединяются в один вызов loader().
+    Устаревшая по времени запись еще stale_ttl секунд отдается сразу, пока одна
+    фоновая задача ее обновляет, и служит запасным значением, если база или
+    Redis недоступны. Новые версии тегов рассылаются другим процессам через
+    channel, и их L1 сбрасывается сразу; без канала инвалидация из других
+    процессов доходит до L1 не позже local_ttl (плюс stale_ttl, если
+    обновление не удается).
+    """
+    def __init__(self, ttl: int, local_ttl: int, local_size: int, redis: Optional[Cache] = None,
+                 stale_ttl: int = 0, channel: Optional[str] = None):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.redis = redis
+        self.stale_ttl = stale_ttl
+        self.channel = InvalidationChannel(redis, channel, self.apply_versions) if redis and channel else None
+        self.stats: Dict[str, Counter] = {}
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, int], Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_or_load(self, name: str, key: str, tags: Iterable[str], loader: Callable[[], Awaitable],
+                          namespace: str = ''):
+        """ Значение из кэша или результат loader(), сохраненный в оба уровня """
+        stats = self.stats.setdefault(name, Counter())
+        key = f"{namespace}:{key}"
+        tags = sorted(f"{namespace}:{tag}" for tag in tags)
+        state, value = self._get_local(key)
+        if state == FRESH:
+            stats['hits_local'] += 1
+            return value
+        if state == STALE:
+            stats['hits_stale'] += 1
+            self._fetch(stats, key, tags, loader, fallback=value)
+            return value
+        return await asyncio.shield(self._fetch(stats, key, tags, loader))
+
+    async def invalidate(self, tags: Iterable[str], namespace: str = ''):
+        """ Инвалидация всех записей с указанными тегами """
+        tags = {f"{namespace}:{tag}" for tag in tags}
+        for tag in tags:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+        stats = self.stats.setdefault('invalidate', Counter())
+        stats['invalidations'] += len(tags)
+        if self.redis is None:
+            return
+        try:
+            for tag in tags:
+                self._versions[tag] = max(self._versions[tag], await self.redis.increment(self._tag_key(tag)))
+            if self.channel is not None:
+                await self.channel.publish({tag: self._versions[tag] for tag in tags})
+        except Exception:
+            logger.warning("Article cache: Redis is unavailable", exc_info=True)
+            stats['errors'] += 1
+
+    def apply_versions(self, versions: Dict[str, int]):
+        """ Версии тегов, увеличенные другим процессом: записи L1 с прежними версиями недействительны """
+        for tag, version in versions.items():
+            if version > self._versions.get(tag, 0):
+                self._versions[tag] = version
+
+    def clear(self):
+        """ Очистка L1 """
+        self._local.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """ Счетчики попаданий, промахов и инвалидаций по функциям """
+        snapshot = {name: dict(counter) for name, counter in self.stats.items()}
+        if self.channel is not None:
+            snapshot['channel'] = dict(self.channel.stats)
+        return snapshot
+
+    def _fetch(self, stats: Counter, key: str, tags: List[str], loader: Callable[[], Awaitable],
+               fallback: Any = MISSING) -> asyncio.Future:
+        """ Единственная на ключ задача загрузки; остальные вызовы ждут ее результата """
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            stats['coalesced'] += 1
+            return task
+        task = asyncio.ensure_future(self._load(stats, key, tags, loader, fallback))
+        self._inflight[key] = task
+
+        def done(finished: asyncio.Future):
+            if self._inflight.get(key) is finished:
+                del self._inflight[key]
+            # Ошибка фонового обновления уже учтена в _load, ее никто не ждет
+            if not finished.cancelled():
+                finished.exception()
+        task.add_done_callback(done)
+        return task
+
+    async def _load(self, stats: Counter, key: str, tags: List[str], loader: Callable[[], Awaitable],
+                    fallback: Any):
+        versions = {tag: self._versions.get(tag, 0) for tag in tags}
+        if self.redis is not None:
+            try:
+                stored, *remote_versions = await self.redis.multi_get([key, *map(self._tag_key, tags)])
+            except Exception:
+                logger.warning("Article cache: Redis is unavailable", exc_info=True)
+                stats['errors'] += 1
+            else:
+                for tag, version in zip(tags, remote_versions):
+                    versions[tag] = max(versions[tag], version or 0)
+                    self._versions[tag] = versions[tag]
+                if stored is not None and stored['versions'] == versions:
+                    if stored['fresh_until'] > time.time():
+                        stats['hits_redis'] += 1
+                        self._set_local(key, versions, stored['value'])
+                        return stored['value']
+                    if fallback is MISSING:
+                        fallback = stored['value']
+
+        stats['misses'] += 1
+        try:
+            value = await loader()
+        except Exception:
+            if fallback is MISSING:
+                raise
+            logger.warning("Article cache: serving stale %s, reload failed", key, exc_info=True)
+            stats['stale_errors'] += 1
+            return fallback
+        self._set_local(key, versions, value)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, {"versions": versions, "value": value,
+                                           "fresh_until": time.time() + self.ttl},
+                                     ttl=self.ttl + self.stale_ttl)
+            except Exception:
+                logger.warning("Article cache: Redis is unavailable", exc_info=True)
+                stats['errors'] += 1
+        return value
+
+    def _get_local(self, key: str) -> Tuple[Optional[str], Any]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None, None
+        fresh_until, versions, value = entry
+        now = time.monotonic()
+        if fresh_until + self.stale_ttl <= now or any(self._versions.get(tag, 0) != version
+                                                      for tag, version in versions.items()):
+            del self._local[key]
+            return None, None
+        self._local.move_to_end(key)
+        return (FRESH if fresh_until > now else STALE), value
+
+    def _set_local(self, key: str, versions: Dict[str, int], value: Any):
+        # Тег мог быть инвалидирован, пока выполнялся запрос к базе
+        if any(self._versions.get(tag, 0) != version for tag, version in versions.items()):
+            return
+        self._local[key] = (time.monotonic() + self.local_ttl, versions, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        return f"tag:{tag}"
+
+
+article_cache = TaggedCache(
+    ARTICLE_CACHE_TTL,
+    ARTICLE_CACHE_LOCAL_TTL,
+    ARTICLE_CACHE_LOCAL_SIZE,
+    Cache(Cache.REDIS, endpoint=REDIS_HOST, port=REDIS_PORT, namespace="articles",
+          serializer=OrjsonSerializer()) if ARTICLE_CACHE_REDIS else None,
+    ARTICLE_CACHE_STALE_TTL,
+    channel="articles:invalidate",
+)
+register_cache("articles", article_cache.snapshot)
+
+
+def article_tags(article: dict, *previous_dates) -> List[str]:
+    """ Теги, которые затрагивает запись статьи """
+    tags = ['all', f"article:{article['id']}", f"author:{article['author_id']}"]
+    for published_date in {article['published_date'], *previous_dates}:
+        tags.append(f"date:{published_date}")
+    return tags
+
+
+def cached_read(key_builder: Callable, tags_builder: Callable[..., Iterable[str]]):
+    """ Кэширование метода чтения DatabaseManager в article_cache """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if getattr(self, 'read_primary', False):
+                # Клиент недавно писал: кэш мог заполниться с отстающей реплики
+                return await func(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            call_args = list(bound.arguments.values())[1:]
+            return await article_cache.get_or_load(
+                func.__name__,
+                key_builder(func, self, *call_args),
+                tags_builder(*call_args),
+                # Загрузка может пережить запрос, поэтому не использует его сессию
+                lambda: func(self.detached(), *call_args),
+                namespace=self.cache_namespace,
+            )
+        return wrapper
+    return decorator
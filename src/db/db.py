@@ -1,16 +1,33 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+import copy
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import delete, func, insert, text, tuple_, update
 from sqlalchemy.future import select
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.db_models import User, Article
-from typing import Optional
-from aiocache import cached, Cache, SimpleMemoryCache
-from aiocache.serializers import PickleSerializer
-from config import REDIS_HOST, REDIS_PORT, DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+from db.db_models import COUNT_SLOTS, User, Article, ArticleCount
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from db.cache import article_cache, article_tags, cached_read
+from db.batching import ArticleBatcher
+from db.replicas import Replica, ReplicaSet, is_unavailable, replica_read
+from metrics.metrics import TimedQueuePool, instrument_engine, register_replicas
+from config import (DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME,
+                    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+                    DB_CONNECTION_BUDGET, WEB_WORKERS,
+                    ARTICLES_EXCERPT_LENGTH, DB_REPLICAS, DB_REPLICA_SELECTION, DB_REPLICA_POOL_SIZE,
+                    DB_REPLICA_MAX_LAG, DB_REPLICA_HEALTH_INTERVAL, DB_READ_YOUR_WRITES_WINDOW,
+                    ARTICLES_BATCH_SIZE, ARTICLES_BATCH_WAIT_MS, ARTICLES_QUEUE_SIZE, ARTICLES_QUEUE_TIMEOUT)
 
-cache = Cache(Cache.REDIS, endpoint=REDIS_HOST, port=REDIS_PORT, serializer=PickleSerializer())
 
-POOL_SIZE = 250
+logger = logging.getLogger(__name__)
+
+# Увеличивается при изменении набора полей в кэшируемых значениях
+CACHE_FORMAT = 2
+# Cookie с временем, до которого чтение клиента идет в основную базу
+PRIMARY_COOKIE = "db_primary_until"
 
 
 def articles_key_builder(function, self, *args):
@@ -19,23 +36,238 @@ def articles_key_builder(function, self, *args):
     per_page = args[1] if len(args) > 1 else 'none'
     author_id = args[2] if len(args) > 2 else 'none'
     date = args[3] if len(args) > 3 else 'none'
-    return f"get_articles:{page}:{per_page}:{author_id}:{date}"
+    after_id = args[4] if len(args) > 4 else 'none'
+    view = args[5] if len(args) > 5 else 'full'
+    return f"get_articles:{page}:{per_page}:{author_id}:{date}:{after_id}:{view}"
+
+
+def articles_tags(page, per_page, author_id=None, date=None, after_id=None, view='full') -> list:
+    """Теги страницы статей: по фильтрам запроса или общий тег списка"""
+    tags = []
+    if author_id is not None:
+        tags.append(f"author:{author_id}")
+    if date is not None:
+        tags.append(f"date:{date}")
+    return tags or ['all']
+
+
+def count_key_builder(function, self, author_id=None, date=None):
+    """Функция для кэширования числа статей: одно значение на набор фильтров для всех страниц"""
+    return f"count_articles:{author_id}:{date}"
+
+
+def count_tags(author_id=None, date=None) -> list:
+    """Число статей инвалидируется вместе со страницами тех же фильтров"""
+    return articles_tags(None, None, author_id, date)
+
+
+def search_key_builder(function, self, query, per_page=10, after_rank=None, after_id=None):
+    """Функция для кэширования результатов поиска"""
+    return f"search_articles:{per_page}:{after_rank}:{after_id}:{query}"
+
+
+def search_tags(query, per_page=10, after_rank=None, after_id=None) -> list:
+    """Результаты поиска может изменить любая запись статьи"""
+    return ['all']
+
+
+def article_key_builder(function, self, article_id):
+    """Функция для кэширования статьи"""
+    return f"get_article_by_id:{article_id}"
+
+
+def article_version_key_builder(function, self, article_id):
+    """Функция для кэширования версии статьи"""
+    return f"get_article_version:{article_id}"
+
+
+# Поля статьи в каждом представлении; summary и excerpt не передают content из базы
+VIEW_COLUMNS = {
+    'full': (Article.id, Article.title, Article.content, Article.published_date, Article.author_id),
+    'summary': (Article.id, Article.title, Article.published_date, Article.author_id),
+    'excerpt': (Article.id, Article.title, Article.published_date, Article.author_id,
+                func.left(Article.content, ARTICLES_EXCERPT_LENGTH).label('excerpt')),
+}
+
+ARTICLE_COLUMNS = (*VIEW_COLUMNS['full'], Article.version, Article.updated_at)
+
+
+# Должна совпадать с конфигурацией в триггере articles_search_vector
+SEARCH_CONFIG = 'russian'
+
+
+class NotEnoughPermissions(Exception):
+    """ Пользователь не может изменять чужую статью """
+
+
+def filter_articles(query, author_id: Optional[int] = None, date: Optional[str] = None):
+    """Фильтры списка статей, общие для страниц и выгрузки"""
+    if author_id is not None:
+        query = query.where(Article.author_id == author_id)
+    if date is not None:
+        query = query.where(Article.published_date == date)
+    return query
+
+
+async def stream_query(session_maker: async_sessionmaker, query, chunk_size: int) -> AsyncIterator[List[dict]]:
+    """ Строки запроса пачками через серверный курсор в отдельной сессии """
+    async with session_maker() as session:
+        result = await session.stream(query, execution_options={"yield_per": chunk_size})
+        try:
+            async for rows in result.mappings().partitions(chunk_size):
+                yield [dict(row) for row in rows]
+        finally:
+            await result.close()
+
+
+def pool_limits(pool_size: int, max_overflow: int, budget: int = DB_CONNECTION_BUDGET,
+                workers: int = WEB_WORKERS, reserved: int = 0) -> Tuple[int, int]:
+    """ pool_size и max_overflow одного процесса в пределах его доли бюджета соединений.
+
+    Доля - budget // workers без reserved соединений процесса вне пула, но не
+    меньше одного соединения. Если пул в нее не помещается, обе величины
+    уменьшаются пропорционально.
+    """
+    if budget <= 0:
+        return pool_size, max_overflow
+    share = max(1, budget // max(1, workers) - reserved)
+    if pool_size + max_overflow <= share:
+        return pool_size, max_overflow
+    size = max(1, share * pool_size // (pool_size + max_overflow))
+    return size, share - size
+
+
+def create_engine(host: str, port: str, database: str, test_mode: bool, pool_size: int = DB_POOL_SIZE,
+                  reserved: int = 0):
+    """ Движок базы: в тестах без пула, иначе с пулом соединений и метриками """
+    connection_string = f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{host}:{port}/{database}'
+    if test_mode:
+        # Тестовый клиент запускает каждый запрос в своём event loop,
+        # поэтому соединения asyncpg нельзя переиспользовать между запросами
+        return create_async_engine(connection_string, poolclass=NullPool)
+    pool_size, max_overflow = pool_limits(pool_size, DB_MAX_OVERFLOW, reserved=reserved)
+    return create_async_engine(
+        connection_string,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        poolclass=TimedQueuePool,
+    )
+
+
+def create_replica(spec: str, database: str, test_mode: bool) -> Replica:
+    """ Реплика из строки host[:port][/dbname] """
+    address, _, replica_database = spec.partition('/')
+    host, _, port = address.partition(':')
+    engine = create_engine(host, port or DB_PORT, replica_database or database, test_mode, DB_REPLICA_POOL_SIZE)
+    name = f"replica:{host}:{port or DB_PORT}/{replica_database or database}"
+    instrument_engine(engine, name)
+    return Replica(name, engine)
+
+
+class Database:
+    """ Движок и фабрика сессий, общие для всего процесса, и реплики для чтения """
+    def __init__(self, test_mode: bool = False):
+        database = f'test_{DB_NAME}' if test_mode else DB_NAME
+        # Соединение LISTEN (db.notifications) открыто вне пула, но входит в бюджет
+        self.engine = create_engine(DB_HOST, DB_PORT, database, test_mode, reserved=1)
+        instrument_engine(self.engine, self.engine.url.database)
+        self.async_session_maker = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.replicas = ReplicaSet(
+            [create_replica(spec, database, test_mode) for spec in DB_REPLICAS],
+            DB_REPLICA_SELECTION, DB_REPLICA_MAX_LAG, DB_REPLICA_HEALTH_INTERVAL,
+        )
+        register_replicas(self.replicas)
+        self.batcher = ArticleBatcher(
+            lambda articles: DatabaseManager(test_mode).add_articles(articles),
+            ARTICLES_BATCH_SIZE, ARTICLES_BATCH_WAIT_MS / 1000, ARTICLES_QUEUE_SIZE, ARTICLES_QUEUE_TIMEOUT,
+        )
+
+    async def dispose(self):
+        """ Запись очереди отложенной записи и закрытие всех соединений пула и реплик """
+        await self.batcher.stop()
+        await self.replicas.dispose()
+        await self.engine.dispose()
+
+
+_databases: Dict[bool, Database] = {}
+
+
+def get_database(test_mode: bool = False) -> Database:
+    """ Получение общего для процесса движка (создается при первом обращении) """
+    database = _databases.get(test_mode)
+    if database is None:
+        database = _databases[test_mode] = Database(test_mode)
+    return database
 
 
+async def dispose_databases():
+    """ Закрытие пулов соединений при остановке приложения """
+    while _databases:
+        _, database = _databases.popitem()
+        await database.dispose()
+
 
 class DatabaseManager:
     """ Класс для работы с базой данных """
     def __init__(self, test_mode: bool = False):
-        if test_mode:
-            connection_string = f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/test_{DB_NAME}'
+        database = get_database(test_mode)
+        self.engine = database.engine
+        self.async_session_maker = database.async_session_maker
+        self.session: Optional[AsyncSession] = None
+        self.replicas = database.replicas
+        self.batcher = database.batcher
+        # Чтение из основной базы: клиент недавно писал, и его изменения могут еще не дойти до реплик
+        self.read_primary = False
+        self.on_write: Optional[Callable[[], None]] = None
+        # Основная и тестовая базы не должны делить записи кэша
+        self.cache_namespace = f"{self.engine.url.database}:v{CACHE_FORMAT}"
+
+    def detached(self) -> "DatabaseManager":
+        """ Менеджер той же базы без сессии запроса (для фоновых задач) """
+        db_manager = copy.copy(self)
+        db_manager.session = None
+        return db_manager
+
+    def on_replica(self, replica: Replica) -> "DatabaseManager":
+        """ Менеджер с сессией реплики (для методов чтения) """
+        db_manager = copy.copy(self)
+        db_manager.session = replica.session_maker()
+        return db_manager
+
+    def _pin_primary(self):
+        """ После записи чтение клиента идет в основную базу (read-your-writes) """
+        if not self.replicas:
+            return
+        self.read_primary = True
+        if self.on_write is not None:
+            self.on_write()
+
+    async def _written(self, tags: Iterable[str]):
+        """ После записи статей: закрепление за основной базой и инвалидация кэша.
+
+        Если есть реплики, инвалидация повторяется, когда они догонят запись:
+        иначе чтение с отстающей реплики могло бы вернуть в кэш старое значение.
+        """
+        self._pin_primary()
+        await article_cache.invalidate(tags, self.cache_namespace)
+        if self.replicas:
+            self.replicas.after_staleness(lambda: article_cache.invalidate(tags, self.cache_namespace))
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        """ Сессия запроса, если она открыта, иначе новая сессия из пула """
+        if self.session is not None:
+            yield self.session
         else:
-            connection_string = f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-        self.engine = create_async_engine(connection_string, pool_size=POOL_SIZE)
-        self.async_session_maker = sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+            async with self.async_session_maker() as session:
+                yield session
 
     async def select_user(self) -> list:
         """ Получение пользователя из базы данных """
-        async with self.async_session_maker() as session:
+        async with self._session() as session:
             result = await session.execute(select(User))
             users = [row.to_dict() for row in result.scalars()]
             for user in users:
@@ -44,87 +276,345 @@ class DatabaseManager:
 
     async def add_user(self, user: User):
         """ Добавление пользователя в базу данных """
-        async with self.async_session_maker() as session:
+        async with self._session() as session:
             session.add(user)
             await session.commit()
+        self._pin_primary()
 
     async def add_article(self, article: Article):
         """ Добавление статьи в базу данных """
-        async with self.async_session_maker() as session:
+        async with self._session() as session:
             session.add(article)
             await session.commit()
+        await self._written(article_tags(article.to_dict()))
+
+    async def enqueue_article(self, article: dict) -> dict:
+        """ Добавление статьи через очередь отложенной записи (пачкой с другими статьями).
+
+        Возвращает статью с id после COMMIT пачки; выбрасывает WriteQueueFull,
+        если очередь заполнена.
+        """
+        created = await self.batcher.submit(article)
+        self._pin_primary()
+        return created
 
+    @replica_read
     async def get_users_dict(self) -> list:
         """ Получение всех пользователей из базы данных в формате словаря """
-        async with self.async_session_maker() as session:
+        async with self._session() as session:
             result = await session.execute(select(User))
             users = result.scalars().all()
             users_dict = [user.to_dict() for user in users]
             return users_dict
 
+    @replica_read
     async def get_user_id_by_article_id(self, article_id: int) -> int:
         """ Получение user_id из базы данных по ID статьи """
-        async with self.async_session_maker() as session:
+        async with self._session() as session:
             result = await session.execute(select(Article).where(Article.id == article_id))
             article = result.scalars().first()
             if article is not None:
                 return article.author_id
 
 
-    @cached(ttl=10, cache=SimpleMemoryCache, key_builder=articles_key_builder)
+    @cached_read(articles_key_builder, articles_tags)
+    @replica_read
     async def get_articles(self, page: int = 1, per_page: int = 10, author_id: Optional[int] = None,
-                        date: Optional[str] = None) -> list:
-        """ Получение статей из базы данных """
-        async with self.async_session_maker() as session:
-            query = select(Article)
-            if author_id is not None:
-                query = query.where(Article.author_id == author_id)
-            if date is not None:
-                query = query.where(Article.published_date == date)
-            query = query.offset((page - 1) * per_page).limit(per_page)
+                        date: Optional[str] = None, after_id: Optional[int] = None, view: str = 'full') -> list:
+        """ Получение статей из базы данных в порядке id.
+
+        Если задан after_id, страница начинается сразу после этой статьи (keyset),
+        и page не используется. view выбирает набор полей (VIEW_COLUMNS).
+        """
+        async with self._session() as session:
+            query = filter_articles(select(*VIEW_COLUMNS[view], Article.version, Article.updated_at),
+                                    author_id, date)
+            if after_id is not None:
+                query = query.where(Article.id > after_id)
+            else:
+                query = query.offset((page - 1) * per_page)
+            query = query.order_by(Article.id).limit(per_page)
 
             result = await session.execute(query)
-            articles = [article.to_dict() for article in result.scalars()]
+            articles = [dict(row) for row in result.mappings()]
             return articles
 
+    @cached_read(count_key_builder, count_tags)
+    @replica_read
+    async def count_articles(self, author_id: Optional[int] = None, date: Optional[str] = None) -> dict:
+        """ Число статей по фильтрам: {"total": число, "exact": точное ли оно}.
+
+        Без фильтра по дате число точное - из счетчиков article_counts, которые
+        поддерживают триггеры: строка автора или сумма COUNT_SLOTS строк общего числа. С датой - оценка
+        планировщика по статистике таблицы (EXPLAIN без выполнения запроса).
+        """
+        if date is None and author_id is not None and author_id < 1:
+            # Служебные строки счетчиков не относятся ни к одному автору
+            return {"total": 0, "exact": True}
+        async with self._session() as session:
+            if date is None:
+                if author_id is None:
+                    query = select(func.sum(ArticleCount.articles)).where(
+                        ArticleCount.author_id.between(-COUNT_SLOTS, -1))
+                else:
+                    query = select(ArticleCount.articles).where(ArticleCount.author_id == author_id)
+                return {"total": int(await session.scalar(query) or 0), "exact": True}
+            query = filter_articles(select(Article.id), author_id, date)
+            compiled = query.compile(dialect=session.bind.dialect, compile_kwargs={"literal_binds": True})
+            plan = await session.scalar(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+            return {"total": int(plan[0]["Plan"]["Plan Rows"]), "exact": False}
+
+    @cached_read(search_key_builder, search_tags)
+    @replica_read
+    async def search_articles(self, query: str, per_page: int = 10, after_rank: Optional[float] = None,
+                              after_id: Optional[int] = None) -> list:
+        """ Полнотекстовый поиск по заголовку и тексту статей.
+
+        Результаты упорядочены по релевантности (rank), затем по id; следующая
+        страница начинается после пары (after_rank, after_id).
+        """
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank_cd(Article.search_vector, ts_query).label('rank')
+        statement = select(*ARTICLE_COLUMNS, rank).where(Article.search_vector.op('@@')(ts_query))
+        if after_id is not None:
+            statement = statement.where(tuple_(rank, Article.id) < tuple_(after_rank, after_id))
+        statement = statement.order_by(rank.desc(), Article.id.desc()).limit(per_page)
+        async with self._session() as session:
+            result = await session.execute(statement)
+            return [dict(row) for row in result.mappings()]
+
+    async def stream_articles(self, author_id: Optional[int] = None, date: Optional[str] = None,
+                              chunk_size: int = 1000, view: str = 'full') -> AsyncIterator[List[dict]]:
+        """ Выгрузка статей пачками через серверный курсор.
+
+        Использует собственную сессию (на реплике, если она есть): выгрузка
+        читается, пока отправляется ответ. Если реплика не ответила до первой
+        пачки, она помечается нездоровой и выгрузка идет из основной базы.
+        Память не зависит от числа строк; при закрытии генератора курсор и
+        соединение освобождаются.
+        """
+        query = filter_articles(select(*VIEW_COLUMNS[view]), author_id, date).order_by(Article.id)
+        replica = None if self.read_primary else self.replicas.choose()
+        if replica is not None:
+            chunks = stream_query(replica.session_maker, query, chunk_size)
+            replica.active += 1
+            try:
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as error:
+                    if not is_unavailable(error):
+                        raise
+                    logger.warning("Replica %s failed, streaming from primary: %r", replica.name, error)
+                    replica.healthy = False
+                else:
+                    yield first
+                    async for rows in chunks:
+                        yield rows
+                    return
+            finally:
+                replica.active -= 1
+                await chunks.aclose()
+        async for rows in stream_query(self.async_session_maker, query, chunk_size):
+            yield rows
+
     async def get_user_by_username(self, username: str) -> dict:
-        """ Получение пользователя из базы данных по имени пользователя """
-        async with self.async_session_maker() as session:
+        """ Получение пользователя из базы данных по имени пользователя.
+
+        Всегда из основной базы: результат попадает в кэш пользователей, и
+        отстающая реплика вернула бы в него роль, уже сброшенную уведомлением.
+        """
+        async with self._session() as session:
             result = await session.execute(select(User).where(User.name == username))
             user = result.scalars().first()
             if user is not None:
                 return user.to_dict()
 
+    @cached_read(article_key_builder, lambda article_id: [f"article:{article_id}"])
+    @replica_read
     async def get_article_by_id(self, article_id: int) -> dict:
         """ Получение статьи из базы данных по ID """
-        async with self.async_session_maker() as session:
+        async with self._session() as session:
             result = await session.execute(select(Article).where(Article.id == article_id))
             article = result.scalars().first()
             if article is not None:
                 return article.to_dict()
 
-    async def update_article(self, article_id: int, article: Article) -> dict:
-        """ Обновление статьи в базе данных """
-        async with self.async_session_maker() as session:
-            result = await session.execute(select(Article).where(Article.id == article_id))
-            db_article = result.scalars().first()
-            if db_article is not None:
-                db_article.title = article.title
-                db_article.content = article.content
-                db_article.published_date = article.published_date
-                await session.commit()
-                return db_article.to_dict()
-
-    async def delete_article(self, article_id: int) -> dict:
-        """ Удаление статьи из базы данных """
-        async with self.async_session_maker() as session:
-            result = await session.execute(select(Article).where(Article.id == article_id))
-            db_article = result.scalars().first()
-            if db_article is not None:
-                session.delete(db_article)
-                await session.commit()
-                return db_article.to_dict()
+    @cached_read(article_version_key_builder, lambda article_id: [f"article:{article_id}"])
+    @replica_read
+    async def get_article_version(self, article_id: int) -> dict:
+        """ Версия статьи для условных запросов (без загрузки текста) """
+        async with self._session() as session:
+            result = await session.execute(
+                select(Article.id, Article.version, Article.updated_at).where(Article.id == article_id))
+            row = result.first()
+            if row is not None:
+                return row._asdict()
+
+    async def update_article(self, article_id: int, article: Article, user_id: Optional[int] = None,
+                             is_admin: bool = True) -> dict:
+        """ Обновление статьи в базе данных одним запросом UPDATE ... RETURNING.
+
+        Право на изменение проверяется в том же запросе: статью может менять
+        ее автор (user_id) или администратор. Возвращает None, если статьи нет,
+        и выбрасывает NotEnoughPermissions, если она принадлежит другому автору.
+        """
+        # Прежняя дата нужна для инвалидации кэша; блокировка в подзапросе
+        # гарантирует, что она прочитана после конкурентных изменений
+        previous = (select(Article.id, Article.published_date)
+                    .where(Article.id == article_id)
+                    .with_for_update()
+                    .subquery())
+        query = (update(Article)
+                 .where(Article.id == previous.c.id)
+                 .values(title=article.title, content=article.content, published_date=article.published_date)
+                 .returning(*ARTICLE_COLUMNS, previous.c.published_date.label('previous_date'))
+                 .execution_options(synchronize_session=False))
+        if not is_admin:
+            query = query.where(Article.author_id == user_id)
+        async with self._session() as session:
+            updated_article = (await session.execute(query)).mappings().first()
+            if updated_article is None:
+                await self._raise_if_exists(session, article_id)
+                return None
+            await session.commit()
+        updated_article = dict(updated_article)
+        previous_date = updated_article.pop('previous_date')
+        await self._written(article_tags(updated_article, previous_date))
+        return updated_article
+
+    async def delete_article(self, article_id: int, user_id: Optional[int] = None, is_admin: bool = True) -> dict:
+        """ Удаление статьи из базы данных одним запросом DELETE ... RETURNING.
+
+        Права проверяются так же, как в update_article.
+        """
+        query = (delete(Article)
+                 .where(Article.id == article_id)
+                 .returning(*ARTICLE_COLUMNS)
+                 .execution_options(synchronize_session=False))
+        if not is_admin:
+            query = query.where(Article.author_id == user_id)
+        async with self._session() as session:
+            deleted_article = (await session.execute(query)).mappings().first()
+            if deleted_article is None:
+                await self._raise_if_exists(session, article_id)
+                return None
+            await session.commit()
+        deleted_article = dict(deleted_article)
+        await self._written(article_tags(deleted_article))
+        return deleted_article
+
+    @staticmethod
+    async def _raise_if_exists(session: AsyncSession, article_id: int):
+        """ Запись не затронула строк: статьи нет или у пользователя нет прав """
+        await session.rollback()
+        exists = await session.scalar(select(Article.id).where(Article.id == article_id))
+        if exists is not None:
+            raise NotEnoughPermissions(article_id)
+
+    async def add_articles(self, articles: List[dict]) -> List[dict]:
+        """ Добавление нескольких статей одной транзакцией (INSERT ... RETURNING) """
+        if not articles:
+            return []
+        async with self._session() as session:
+            result = await session.scalars(insert(Article).returning(Article, sort_by_parameter_order=True), articles)
+            created = [article.to_dict() for article in result.all()]
+            await session.commit()
+        await self._written({tag for article in created for tag in article_tags(article)})
+        return created
+
+    async def update_articles(self, articles: List[dict], user_id: int, is_admin: bool) -> List[dict]:
+        """ Обновление нескольких статей одной транзакцией.
+
+        Права проверяются одним запросом для всей пачки; статьи, которых нет
+        или которые принадлежат другому автору, пропускаются. Возвращает
+        результат для каждой статьи в порядке запроса.
+        """
+        async with self._session() as session:
+            current = await self._lock_articles(session, [article['id'] for article in articles])
+            results = [_bulk_result(current, article['id'], user_id, is_admin) for article in articles]
+            allowed = [article for article, result in zip(articles, results) if result['status_code'] == 200]
+            if allowed:
+                await session.execute(update(Article), allowed)
+            await session.commit()
+        tags = set()
+        for article, result in zip(articles, results):
+            if result['status_code'] == 200:
+                result['article'] = {**article, 'author_id': current[article['id']]['author_id']}
+                tags.update(article_tags(result['article'], current[article['id']]['published_date']))
+        await self._written(tags)
+        return results
+
+    async def delete_articles(self, article_ids: List[int], user_id: int, is_admin: bool) -> List[dict]:
+        """ Удаление нескольких статей одной транзакцией (DELETE ... RETURNING) """
+        async with self._session() as session:
+            current = await self._lock_articles(session, article_ids)
+            results = [_bulk_result(current, article_id, user_id, is_admin) for article_id in article_ids]
+            allowed = [result['id'] for result in results if result['status_code'] == 200]
+            deleted = {}
+            if allowed:
+                rows = await session.scalars(
+                    delete(Article).where(Article.id.in_(allowed)).returning(Article),
+                    execution_options={"synchronize_session": False},
+                )
+                deleted = {article.id: article.to_dict() for article in rows.all()}
+            await session.commit()
+        for result in results:
+            result['article'] = deleted.get(result['id'])
+        await self._written({tag for article in deleted.values() for tag in article_tags(article)})
+        return results
+
+    @staticmethod
+    async def _lock_articles(session: AsyncSession, article_ids: List[int]) -> Dict[int, dict]:
+        """ Автор и дата статей с блокировкой строк до конца транзакции """
+        result = await session.execute(
+            select(Article.id, Article.author_id, Article.published_date)
+            .where(Article.id.in_(set(article_ids)))
+            .with_for_update()
+        )
+        return {row.id: row._asdict() for row in result}
 
     async def close(self):
-        """ Закрытие соединения с базой данных """
-        await self.engine.dispose()
+        """ Возврат соединения запроса в пул """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+def primary_until(request: Request) -> float:
+    """ Время из cookie PRIMARY_COOKIE (не дальше окна, чтобы клиент не закрепился навсегда) """
+    try:
+        until = float(request.cookies.get(PRIMARY_COOKIE, 0))
+    except ValueError:
+        return 0
+    return min(until, time.time() + DB_READ_YOUR_WRITES_WINDOW)
+
+
+def _bulk_result(current: Dict[int, dict], article_id: int, user_id: int, is_admin: bool) -> dict:
+    """ Результат проверки одной статьи из пачки """
+    article = current.get(article_id)
+    if article is None:
+        return {"id": article_id, "status_code": 404, "detail": "Article not found", "article": None}
+    if not is_admin and article['author_id'] != user_id:
+        return {"id": article_id, "status_code": 403, "detail": "Not enough permissions", "article": None}
+    return {"id": article_id, "status_code": 200, "detail": None, "article": None}
+
+
+async def get_db_manager(request: Request, response: Response) -> AsyncIterator[DatabaseManager]:
+    """ Зависимость FastAPI: менеджер базы данных с сессией на время запроса.
+
+    После записи клиент получает cookie PRIMARY_COOKIE со временем, до
+    которого его чтение идет в основную базу, а не на реплики.
+    """
+    db_manager = DatabaseManager()
+    db_manager.session = db_manager.async_session_maker()
+    if db_manager.replicas:
+        db_manager.read_primary = primary_until(request) > time.time()
+        db_manager.on_write = lambda: response.set_cookie(
+            PRIMARY_COOKIE, str(int(time.time() + DB_READ_YOUR_WRITES_WINDOW)),
+            max_age=int(DB_READ_YOUR_WRITES_WINDOW), httponly=True, samesite="lax")
+    try:
+        yield db_manager
+    finally:
+        await db_manager.close()
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Date
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, DateTime, ForeignKey, Date, Index, FetchedValue, func, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
 from config import TABLENAME_U, TABLENAME_A, FOREIGN_KEY_U
@@ -14,7 +15,7 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
-    name = Column(String)
+    name = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
     role = Column(String, default='user')
@@ -38,9 +39,23 @@ class Article(Base):
     content = Column(String)
     published_date = Column(Date)
     author_id = Column(Integer, ForeignKey(FOREIGN_KEY_U))
+    # Обновляются триггером articles_touch при каждом UPDATE
+    version = Column(Integer, nullable=False, server_default=text('1'), server_onupdate=FetchedValue())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(),
+                        server_onupdate=FetchedValue())
+    # Заполняется триггером articles_search_vector, в ответы не попадает
+    search_vector = deferred(Column(TSVECTOR))
 
     author = relationship("User", back_populates=TABLENAME_A)
 
+    __table_args__ = (
+        Index('ix_articles_author_id_id', 'author_id', 'id'),
+        Index('ix_articles_published_date_id', 'published_date', 'id'),
+        Index('ix_articles_author_id_published_date_id', 'author_id', 'published_date', 'id'),
+        Index('ix_articles_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -48,6 +63,22 @@ class Article(Base):
             "content": self.content,
             "published_date": self.published_date,
             "author_id": self.author_id,
+            "version": self.version,
+            "updated_at": self.updated_at,
         }
 
     User.articles = relationship("Article", back_populates="author")
+
+
+# Общее число статей - сумма строк article_counts с author_id от -COUNT_SLOTS до -1
+# (по строке на группу соединений, см. триггер articles_count)
+COUNT_SLOTS = 16
+
+
+class ArticleCount(Base):
+    """ Число статей автора (author_id 0 - статьи без автора, отрицательные - доли общего числа);
+    обновляется триггерами articles_count, строки с нулем удаляются """
+    __tablename__ = 'article_counts'
+
+    author_id = Column(Integer, primary_key=True, autoincrement=False)
+    articles = Column(BigInteger, nullable=False, server_default=text('0'))
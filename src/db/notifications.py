@@ -0,0 +1,67 @@
+""" Уведомления PostgreSQL (LISTEN/NOTIFY) на отдельном соединении процесса """
+import asyncio
+import logging
+from typing import Callable, Optional
+
+import asyncpg
+from sqlalchemy.engine import URL
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseListener:
+    """ Подписка на канал NOTIFY.
+
+    handler(payload) вызывается в каждом подписанном процессе после COMMIT
+    транзакции, отправившей уведомление, кто бы ее ни выполнил. Соединение
+    открывается вне пула (оно занято постоянно) и проверяется раз в interval
+    секунд. Пока его нет, уведомления теряются, поэтому после каждого
+    подключения вызывается on_connect (например, очистка кэша).
+    """
+    def __init__(self, url: URL, channel: str, handler: Callable[[str], None],
+                 on_connect: Optional[Callable[[], None]] = None, interval: float = 5):
+        self.url = url
+        self.channel = channel
+        self.handler = handler
+        self.on_connect = on_connect
+        self.interval = interval
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """ Подписка в фоне """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                connection = await asyncpg.connect(user=self.url.username, password=self.url.password,
+                                                   host=self.url.host, port=self.url.port,
+                                                   database=self.url.database)
+            except Exception as error:
+                logger.warning("Listener %s: database is unavailable: %r", self.channel, error)
+                await asyncio.sleep(self.interval)
+                continue
+            try:
+                await connection.add_listener(self.channel, self._notify)
+                self.connected = True
+                if self.on_connect is not None:
+                    self.on_connect()
+                while True:
+                    await asyncio.sleep(self.interval)
+                    await asyncio.wait_for(connection.execute("SELECT 1"), self.interval)
+            except Exception as error:
+                logger.warning("Listener %s: connection lost: %r", self.channel, error)
+            finally:
+                self.connected = False
+                connection.terminate()
+
+    def _notify(self, connection, pid: int, channel: str, payload: str):
+        self.handler(payload)
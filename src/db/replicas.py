@@ -0,0 +1,160 @@
+""" Реплики для чтения: выбор реплики, проверка здоровья и откат на основную базу """
+import asyncio
+import functools
+import itertools
+import logging
+from typing import Awaitable, Callable, List, Optional, Set
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = 'round_robin'
+LEAST_LOADED = 'least_loaded'
+
+# Отставание реплики в секундах; 0, если она воспроизвела все полученные изменения
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    """ Движок одной реплики и ее состояние """
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        self.healthy = True
+        self.lag = 0.0
+        self.active = 0
+
+
+class ReplicaSet:
+    """ Реплики, между которыми распределяется чтение.
+
+    Реплика исключается, если проверка не прошла, отставание больше max_lag
+    или запрос к ней не смог соединиться; проверка раз в interval секунд
+    возвращает ее обратно. Без здоровых реплик чтение идет в основную базу.
+    """
+    def __init__(self, replicas: List[Replica], selection: str = ROUND_ROBIN, max_lag: float = 5,
+                 interval: float = 2, timeout: float = 2):
+        self.replicas = replicas
+        self.selection = selection
+        self.max_lag = max_lag
+        self.interval = interval
+        self.timeout = timeout
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    @property
+    def staleness(self) -> float:
+        """ Наибольшее отставание реплики, которая считается здоровой """
+        return self.max_lag + self.interval
+
+    def choose(self) -> Optional[Replica]:
+        """ Реплика для следующего чтения или None """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.selection == LEAST_LOADED:
+            return min(healthy, key=lambda replica: replica.active)
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def check(self):
+        """ Проверка всех реплик """
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def _check(self, replica: Replica):
+        try:
+            replica.lag = float(await asyncio.wait_for(self._lag(replica), self.timeout))
+        except Exception as error:
+            if replica.healthy:
+                logger.warning("Replica %s is unavailable: %r", replica.name, error)
+            replica.healthy = False
+            return
+        healthy = replica.lag <= self.max_lag
+        if healthy != replica.healthy:
+            logger.warning("Replica %s is %s (lag %.1fs)", replica.name, "back" if healthy else "lagging",
+                           replica.lag)
+        replica.healthy = healthy
+
+    @staticmethod
+    async def _lag(replica: Replica) -> float:
+        async with replica.engine.connect() as conn:
+            return await conn.scalar(LAG_QUERY)
+
+    def start(self):
+        """ Периодическая проверка реплик в фоне """
+        if self.replicas and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def after_staleness(self, action: Callable[[], Awaitable]):
+        """ Повтор действия (инвалидации кэша), когда реплики гарантированно догонят запись """
+        loop = asyncio.get_running_loop()
+
+        def run():
+            task = loop.create_task(action())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        loop.call_later(self.staleness, run)
+
+    async def dispose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def snapshot(self) -> List[dict]:
+        return [{"name": replica.name, "healthy": replica.healthy, "lag": replica.lag, "active": replica.active}
+                for replica in self.replicas]
+
+
+def is_unavailable(error: BaseException) -> bool:
+    """ Ошибка соединения с базой, а не ошибка самого запроса """
+    if isinstance(error, (OSError, asyncio.TimeoutError, exc.TimeoutError, exc.OperationalError,
+                          exc.InterfaceError)):
+        return True
+    return isinstance(error, exc.DBAPIError) and error.connection_invalidated
+
+
+def replica_read(func):
+    """ Выполнение метода чтения DatabaseManager на реплике.
+
+    В основную базу чтение идет, если реплик нет или все нездоровы, если
+    менеджер закреплен за основной базой (read_primary) и если реплика не
+    ответила - тогда она помечается нездоровой до следующей проверки.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        replica = None if self.read_primary else self.replicas.choose()
+        if replica is None:
+            return await func(self, *args, **kwargs)
+        reader = self.on_replica(replica)
+        replica.active += 1
+        try:
+            return await func(reader, *args, **kwargs)
+        except Exception as error:
+            if not is_unavailable(error):
+                raise
+            logger.warning("Replica %s failed, reading from primary: %r", replica.name, error)
+            replica.healthy = False
+        finally:
+            replica.active -= 1
+            await reader.close()
+        return await func(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,142 @@
+""" Прогрев приложения при старте, до того как на него пойдет трафик """
+import asyncio
+import inspect
+import logging
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.pool import QueuePool
+
+from config import WARMUP_CONNECTIONS, WARMUP_ENABLED, WARMUP_PRELOAD_PAGES, WARMUP_RETRY_INTERVAL
+from db.db import DatabaseManager, get_database
+from metrics.metrics import WARMUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Горячие методы чтения и аргументы, дающие каждый вариант их SQL. Значения
+# передаются параметрами, поэтому один вызов готовит запрос для любых значений
+PRIMED_READS = (
+    ("get_articles", (1, 10)),
+    ("get_articles", (1, 10, None, None, 0)),
+    ("get_articles", (1, 10, 0)),
+    ("get_articles", (1, 10, 0, None, 0)),
+    ("get_articles", (1, 10, None, date(1970, 1, 1))),
+    ("get_articles", (1, 10, 0, date(1970, 1, 1))),
+    ("get_articles", (1, 10, None, None, None, 'summary')),
+    ("get_articles", (1, 10, None, None, None, 'excerpt')),
+    ("search_articles", ("warmup",)),
+    ("get_article_by_id", (0,)),
+    ("get_article_version", (0,)),
+    ("get_user_by_username", ("",)),
+    ("get_user_id_by_article_id", (0,)),
+    ("count_articles", ()),
+    ("count_articles", (0,)),
+)
+# Размер страницы GET /articles/ по умолчанию: с ним совпадают ключи кэша
+PRELOAD_PER_PAGE = 10
+
+
+class Warmup:
+    """ Прогрев: открытие соединений пула, подготовка запросов и загрузка страниц в кэш.
+
+    Идет в фоне после старта: /health отвечает сразу, а /ready - после
+    прогрева. Если база недоступна, прогрев повторяется каждые retry_interval
+    секунд, и приложение остается неготовым.
+    """
+    def __init__(self, test_mode: bool = False, enabled: bool = WARMUP_ENABLED,
+                 connections: int = WARMUP_CONNECTIONS, preload_pages: int = WARMUP_PRELOAD_PAGES,
+                 retry_interval: float = WARMUP_RETRY_INTERVAL):
+        self.test_mode = test_mode
+        self.enabled = enabled
+        self.connections = connections
+        self.preload_pages = preload_pages
+        self.retry_interval = retry_interval
+        self.ready = not enabled
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """ Запуск прогрева в фоне """
+        if not self.ready and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+                return
+            except Exception as error:
+                self.error = repr(error)
+                logger.warning("Warm-up failed, retrying in %ss: %r", self.retry_interval, error)
+                await asyncio.sleep(self.retry_interval)
+
+    async def run(self):
+        """ Все шаги прогрева; после них приложение готово """
+        started = time.perf_counter()
+        database = get_database(self.test_mode)
+        await self._timed("connections", self._warm_engines(database))
+        if self.preload_pages:
+            await self._timed("preload", self._preload())
+        self._record("total", time.perf_counter() - started)
+        self.ready, self.error = True, None
+        logger.info("Warm-up finished: %s", self.timings)
+
+    async def _timed(self, step: str, coroutine):
+        started = time.perf_counter()
+        await coroutine
+        self._record(step, time.perf_counter() - started)
+
+    def _record(self, step: str, seconds: float):
+        self.timings[step] = round(seconds, 4)
+        WARMUP_SECONDS.labels(step).set(seconds)
+
+    async def _warm_engines(self, database):
+        engines = [database.engine, *(replica.engine for replica in database.replicas.replicas)]
+        await asyncio.gather(*(self._warm_engine(engine) for engine in engines))
+
+    async def _warm_engine(self, engine: AsyncEngine):
+        """ Открытие соединений пула и подготовка горячих запросов на каждом из них.
+
+        Соединения удерживаются одновременно, чтобы пул открыл их все; при
+        возврате они остаются в пуле. asyncpg кэширует подготовленные запросы
+        в каждом соединении, а SQLAlchemy - скомпилированный SQL в движке.
+        """
+        pool = engine.sync_engine.pool
+        count = min(self.connections, pool.size()) if isinstance(pool, QueuePool) else 1
+        opened = await asyncio.gather(*(engine.connect().start() for _ in range(count)), return_exceptions=True)
+        connections = [connection for connection in opened if isinstance(connection, AsyncConnection)]
+        try:
+            errors = [error for error in opened if isinstance(error, BaseException)]
+            if errors:
+                raise errors[0]
+            await asyncio.gather(*(self._prime(connection) for connection in connections))
+        finally:
+            for connection in connections:
+                await connection.close()
+
+    async def _prime(self, connection: AsyncConnection):
+        db_manager = DatabaseManager(self.test_mode)
+        db_manager.session = AsyncSession(bind=connection, expire_on_commit=False)
+        try:
+            for name, args in PRIMED_READS:
+                # Без кэша и выбора реплики: запрос должен выполниться на этом соединении
+                await inspect.unwrap(getattr(DatabaseManager, name))(db_manager, *args)
+        finally:
+            await db_manager.close()
+
+    async def _preload(self):
+        db_manager = DatabaseManager(self.test_mode)
+        await asyncio.gather(*(db_manager.get_articles(page, PRELOAD_PER_PAGE)
+                               for page in range(1, self.preload_pages + 1)))
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, "error": self.error, "timings": self.timings}
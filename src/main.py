@@ -1,16 +1,69 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from auth.router import  router as auth
 from articles.router import router as articles
+from db.db import get_database, dispose_databases
+from db.cache import article_cache
+from auth.principal_cache import listen_for_user_changes, principal_cache
+from db.warmup import Warmup
+from metrics.middleware import MetricsMiddleware
+from compression.middleware import CompressionMiddleware
+from metrics.router import router as metrics
 import logging
 logging.getLogger('passlib').setLevel(logging.ERROR)
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Общий пул соединений с базой данных, проверка реплик, каналы инвалидации кэшей и прогрев"""
+    app.state.database = get_database()
+    app.state.database.replicas.start()
+    channels = [cache.channel for cache in (article_cache, principal_cache) if cache.channel is not None]
+    for channel in channels:
+        channel.start()
+    app.state.user_changes = listen_for_user_changes(app.state.database.engine.url)
+    app.state.user_changes.start()
+    app.state.warmup = Warmup()
+    app.state.warmup.start()
+    yield
+    await app.state.warmup.stop()
+    await app.state.user_changes.stop()
+    for channel in channels:
+        await channel.stop()
+    await dispose_databases()
+
 
 app = FastAPI(
-    title="Orher Code API"
+    title="Orher Code API",
+    lifespan=lifespan
 )
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth)
 app.include_router(articles)
+app.include_router(metrics)
+
+
+@app.get("/cache/stats", tags=["cache"])
+async def cache_stats():
+    """Счетчики попаданий, промахов и инвалидаций кэша статей"""
+    return article_cache.snapshot()
+
+
+@app.get("/health", tags=["health"])
+async def health():
+    """Процесс жив и отвечает (без обращения к базе)"""
+    return {"status": "ok"}
+
 
+@app.get("/ready", tags=["health"])
+async def ready(request: Request):
+    """Готовность принимать трафик: 503, пока не закончился прогрев"""
+    warmup = getattr(request.app.state, "warmup", None)
+    if warmup is None or not warmup.ready:
+        return JSONResponse({"status": "warming up", **(warmup.snapshot() if warmup else {})}, status_code=503)
+    return {"status": "ready", **warmup.snapshot()}
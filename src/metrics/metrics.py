@@ -0,0 +1,172 @@
+""" Метрики в формате Prometheus: HTTP, запросы к базе, пул соединений, кэши и bcrypt """
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DB_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PASSWORD_BUCKETS = (.01, .025, .05, .1, .2, .3, .5, 1, 2, 5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Время обработки запроса", ["method", "route", "status"])
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Запросы, которые обрабатываются сейчас")
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Число запросов к базе за один HTTP-запрос", ["method", "route"],
+    buckets=QUERY_COUNT_BUCKETS)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Суммарное время запросов к базе за один HTTP-запрос", ["method", "route"],
+    buckets=DB_BUCKETS)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Время выполнения запроса к базе", ["database"], buckets=DB_BUCKETS)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "Запросы к базе, завершившиеся ошибкой", ["database"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание соединения из пула (включая открытие нового)", ["database"],
+    buckets=DB_BUCKETS)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "Время работы bcrypt в пуле потоков", ["operation"],
+    buckets=PASSWORD_BUCKETS)
+
+WRITE_BATCH_ROWS = Histogram(
+    "db_write_batch_rows", "Статьи в одной пачке отложенной записи", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+WRITE_QUEUE_REJECTED = Counter(
+    "db_write_queue_rejected_total", "Статьи, отклоненные из-за заполненной очереди отложенной записи")
+
+WARMUP_SECONDS = Gauge(
+    "app_warmup_seconds", "Длительность шагов прогрева при старте", ["step"])
+
+
+@dataclass
+class RequestStats:
+    """ Запросы к базе, выполненные в рамках одного HTTP-запроса """
+    queries: int = 0
+    query_seconds: float = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """ Пул соединений, замеряющий время ожидания свободного соединения """
+    database = ""
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.database = self.database
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(self.database).observe(time.perf_counter() - started)
+
+
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def instrument_engine(engine: AsyncEngine, database: str):
+    """ Подписка на события движка: время и число запросов, состояние пула """
+    sync_engine = engine.sync_engine
+    if isinstance(sync_engine.pool, TimedQueuePool):
+        sync_engine.pool.database = database
+    _engines[database] = engine
+    query_seconds = DB_QUERY_SECONDS.labels(database)
+    query_errors = DB_QUERY_ERRORS.labels(database)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        query_seconds.observe(elapsed)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+        query_errors.inc()
+
+
+_caches: Dict[str, Callable[[], Dict[str, Dict[str, int]]]] = {}
+
+
+def register_cache(name: str, snapshot: Callable[[], Dict[str, Dict[str, int]]]):
+    """ Регистрация счетчиков кэша: snapshot() возвращает {функция: {событие: число}} """
+    _caches[name] = snapshot
+
+
+_replica_sets: List[Callable[[], List[dict]]] = []
+
+
+def register_replicas(replicas):
+    """ Регистрация набора реплик: replicas.snapshot() возвращает состояние каждой реплики """
+    _replica_sets.append(replicas.snapshot)
+
+
+class StateCollector:
+    """ Значения, которые дешевле прочитать при сборе метрик, чем обновлять на каждом запросе """
+    HITS = ("hits_local", "hits_stale", "hits_redis")
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Выданные соединения пула", labels=["database"])
+        capacity = GaugeMetricFamily("db_pool_capacity", "Максимум соединений пула (size + max_overflow)",
+                                     labels=["database"])
+        utilization = GaugeMetricFamily("db_pool_utilization", "Доля занятых соединений пула", labels=["database"])
+        for database, engine in list(_engines.items()):
+            pool = engine.sync_engine.pool
+            if not isinstance(pool, AsyncAdaptedQueuePool):
+                continue
+            limit = pool.size() + max(pool._max_overflow, 0)
+            checked_out.add_metric([database], pool.checkedout())
+            capacity.add_metric([database], limit)
+            utilization.add_metric([database], pool.checkedout() / limit if limit else 0)
+        yield from (checked_out, capacity, utilization)
+
+        events = CounterMetricFamily("cache_events", "События кэшей по функциям",
+                                     labels=["cache", "function", "event"])
+        hit_ratio = GaugeMetricFamily("cache_hit_ratio", "Доля попаданий с запуска процесса",
+                                      labels=["cache", "function"])
+        for cache, snapshot in list(_caches.items()):
+            for function, counters in snapshot().items():
+                for name, value in counters.items():
+                    events.add_metric([cache, function, name], value)
+                hits = sum(counters.get(name, 0) for name in self.HITS)
+                lookups = hits + counters.get("misses", 0)
+                if lookups:
+                    hit_ratio.add_metric([cache, function], hits / lookups)
+        yield from (events, hit_ratio)
+
+        healthy = GaugeMetricFamily("db_replica_healthy", "Реплика получает чтение (1) или исключена (0)",
+                                    labels=["replica"])
+        lag = GaugeMetricFamily("db_replica_lag_seconds", "Отставание реплики при последней проверке",
+                                labels=["replica"])
+        active = GaugeMetricFamily("db_replica_active_reads", "Выполняемые сейчас чтения на реплике",
+                                   labels=["replica"])
+        for snapshot in list(_replica_sets):
+            for replica in snapshot():
+                healthy.add_metric([replica["name"]], int(replica["healthy"]))
+                lag.add_metric([replica["name"]], replica["lag"])
+                active.add_metric([replica["name"]], replica["active"])
+        yield from (healthy, lag, active)
+
+
+REGISTRY.register(StateCollector())
@@ -0,0 +1,64 @@
+import time
+from typing import Callable, Dict
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics.metrics import (HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS, HTTP_REQUEST_DB_QUERIES,
+                             HTTP_REQUEST_DB_SECONDS, RequestStats, request_stats)
+
+UNMATCHED = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """ Время обработки, число запросов к базе и запросы в работе по шаблонам маршрутов.
+
+    ASGI-middleware без обертки запроса в Request: на запрос приходится
+    несколько вызовов perf_counter и обновление трех гистограмм.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            request_stats.reset(token)
+            method, route = scope["method"], self._route(scope)
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status)).observe(elapsed)
+            HTTP_REQUEST_DB_QUERIES.labels(method, route).observe(stats.queries)
+            HTTP_REQUEST_DB_SECONDS.labels(method, route).observe(stats.query_seconds)
+
+    def _route(self, scope: Scope) -> str:
+        """ Шаблон пути (/articles/{article_id}), чтобы число меток не росло с числом id """
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope["app"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            else:
+                route = UNMATCHED
+            self._routes[endpoint] = route
+        return route
@@ -0,0 +1,19 @@
+""" Запуск приложения в WEB_WORKERS процессах uvicorn.
+
+    python serve.py
+
+Число процессов, адрес и бюджет соединений с базой (DB_CONNECTION_BUDGET)
+задаются в config.py; каждый процесс берет свою долю бюджета в пул.
+"""
+import uvicorn
+
+from config import WEB_HOST, WEB_PORT, WEB_WORKERS
+
+
+def main():
+    # Импорт строкой: каждый воркер импортирует приложение сам
+    uvicorn.run("main:app", host=WEB_HOST, port=WEB_PORT, workers=WEB_WORKERS)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,100 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import date
+from collections import Counter
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
 import pytest
 from main import app
-from config import TEST_USERNAME, TEST_PASSWORD
-from db.db import DatabaseManager
+from config import (TEST_USERNAME, TEST_PASSWORD, ARTICLES_BULK_MAX, DB_HOST, DB_PORT, DB_NAME,
+                    ARTICLE_CACHE_REDIS, REDIS_HOST, REDIS_PORT)
+from db.db import (DatabaseManager, PRIMARY_COOKIE, create_replica, get_database, get_db_manager, pool_limits,
+                   primary_until)
+from db.batching import ArticleBatcher, WriteQueueFull
+from db.replicas import ReplicaSet
+from db.warmup import Warmup
+from auth.principal_cache import PrincipalCache, listen_for_user_changes, principal_cache
+from auth.auth import authenticate_user
+from auth.passwords import PasswordHasher, PasswordHasherBusy
+from aiocache import Cache
+from db.cache import OrjsonSerializer, TaggedCache, article_cache
+from articles.responses import fast_json_response
+from fastapi import FastAPI, Request, Response
+from sqlalchemy import event, func, select, text, update
+from db.db_models import Article, ArticleCount, User
+from compression.codecs import available_codecs, negotiate
+from articles.conditional import is_not_modified, not_modified_response, set_validators
+from compression.middleware import CompressionMiddleware, compressed_bodies, precompress
 
 
 def override_db_manager():
     """Функция для переопределения зависимости DatabaseManager в тестах"""
     return DatabaseManager(test_mode=True)
 
-app.dependency_overrides[DatabaseManager] = override_db_manager
+app.dependency_overrides[get_db_manager] = override_db_manager
 client = TestClient(app)
 
 
+class QueryRecorder:
+    """Запросы, выполненные через движок DatabaseManager, и обращения к базе за транзакциями"""
+
+    TRANSACTION_EVENTS = ("begin", "commit", "rollback")
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.statements = []
+        self.transactions = 0
+
+    @property
+    def round_trips(self):
+        return len(self.statements) + self.transactions
+
+    def repeated(self, max_repeats):
+        """Одинаковые запросы, выполненные больше max_repeats раз (похоже на N+1)"""
+        return {statement: count for statement, count in Counter(self.statements).items() if count > max_repeats}
+
+    def _statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def _transaction(self, conn):
+        self.transactions += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._statement)
+        for name in self.TRANSACTION_EVENTS:
+            event.listen(self.engine, name, self._transaction)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._statement)
+        for name in self.TRANSACTION_EVENTS:
+            event.remove(self.engine, name, self._transaction)
+
+
+@contextmanager
+def query_budget(statements, round_trips=None, max_repeats=1):
+    """Проверка, что код внутри блока укладывается в бюджет запросов к тестовой базе"""
+    with QueryRecorder(get_database(test_mode=True).engine) as recorder:
+        yield recorder
+    executed = "\n".join(recorder.statements)
+    assert len(recorder.statements) <= statements, f"{len(recorder.statements)} statements > {statements}:\n{executed}"
+    if round_trips is not None:
+        assert recorder.round_trips <= round_trips, f"{recorder.round_trips} round trips > {round_trips}:\n{executed}"
+    repeated = recorder.repeated(max_repeats)
+    assert not repeated, f"Possible N+1, repeated statements: {repeated}"
+
+
+def forget_cached_reads():
+    """Сброс кэшей, чтобы запрос дошел до базы"""
+    article_cache.clear()
+    asyncio.run(article_cache.invalidate(["all"], DatabaseManager(test_mode=True).cache_namespace))
+    principal_cache.clear()
+
+
 @pytest.fixture(scope="module")
 def access_token():
     """Функция для получения токена доступа"""
@@ -36,6 +118,13 @@ def test_login_for_access_token_invalid_credentials():
     assert response.status_code == 422
 
 
+def test_login_for_access_token_wrong_password():
+    """Тест для проверки аутентификации с неверным паролем существующего пользователя"""
+
+    response = client.post("auth/token", json={"username": TEST_USERNAME, "password": "invalid"})
+    assert response.status_code == 401
+
+
 def test_read_article():
     """Тест для проверки получения статьи по id"""
 
@@ -49,6 +138,45 @@ def test_read_article():
     assert "author_id" in response.json()
     assert response.json()["id"] == test_article_id
 
+def test_read_article_conditional_get(access_token):
+    """Тест для условного получения статьи по ETag и Last-Modified"""
+
+    response = client.get("/articles/2")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    response = client.get("/articles/2", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/articles/2", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 304
+
+    client.put("/articles/2", json={"title": "Conditional", "content": "Changed", "author_id": 2},
+               headers={"Authorization": f"Bearer {access_token}"})
+    response = client.get("/articles/2", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_read_articles_conditional_get():
+    """Тест для условного получения страницы статей по ETag"""
+
+    response = client.get("/articles?per_page=2")
+    assert response.status_code == 200
+    response = client.get("/articles?per_page=2", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_read_articles_conditional_get_weak_validator():
+    """Тест для условного получения по слабому ETag (W/) в списке If-None-Match"""
+
+    etag = client.get("/articles?per_page=2").headers["ETag"]
+    response = client.get("/articles?per_page=2", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    response = client.get("/articles?per_page=2", headers={"If-None-Match": 'W/"other"'})
+    assert response.status_code == 200
+
 def test_read_article_not_found():
     """Тест для проверки получения несуществующей статьи"""
 
@@ -140,6 +268,66 @@ def test_update_article_as_author(access_token):
     assert response.json()["title"] == "Updated Title"
     assert response.json()["content"] == "Updated Content"
 
+def test_bulk_create_update_delete_articles(access_token):
+    """Тест для массового создания, обновления и удаления статей"""
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.post("/articles/bulk", json=[
+        {"title": "Bulk 1", "content": "Content", "author_id": 2},
+        {"title": "Bulk 2", "content": "Content", "author_id": 2, "published_date": "2024-02-02"},
+    ], headers=headers)
+    assert response.status_code == 200
+    created = response.json()
+    assert [item["status_code"] for item in created] == [200, 200]
+    assert [item["article"]["title"] for item in created] == ["Bulk 1", "Bulk 2"]
+    ids = [item["id"] for item in created]
+
+    response = client.patch("/articles/bulk", json=[
+        {"id": ids[0], "title": "Bulk 1 updated", "content": "Updated"},
+        {"id": 1, "title": "Not mine", "content": "Updated"},
+        {"id": 999999, "title": "Missing", "content": "Updated"},
+    ], headers=headers)
+    assert response.status_code == 200
+    assert [item["status_code"] for item in response.json()] == [200, 403, 404]
+    assert client.get(f"/articles/{ids[0]}").json()["title"] == "Bulk 1 updated"
+
+    response = client.request("DELETE", "/articles/bulk", json=ids, headers=headers)
+    assert response.status_code == 200
+    assert [item["status_code"] for item in response.json()] == [200, 200]
+    assert client.get(f"/articles/{ids[1]}").status_code == 404
+
+def test_bulk_create_articles_over_limit(access_token):
+    """Тест для массового создания статей сверх допустимого размера пачки"""
+
+    article = {"title": "Bulk", "content": "Content", "author_id": 2}
+    response = client.post("/articles/bulk", json=[article] * (ARTICLES_BULK_MAX + 1),
+                           headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 413
+
+def test_update_article_of_another_author(access_token):
+    """Тест для обновления чужой статьи"""
+
+    response = client.put("/articles/1", json={
+    "title": "Updated Title",
+    "content": "Updated Content",
+    "author_id": 1
+}, headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 403
+    assert client.get("/articles/1").json()["title"] != "Updated Title"
+
+def test_delete_article_of_another_author(access_token):
+    """Тест для удаления чужой статьи"""
+
+    response = client.delete("/articles/1", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 403
+    assert client.get("/articles/1").status_code == 200
+
+def test_delete_nonexistent_article(access_token):
+    """Тест для удаления несуществующей статьи"""
+
+    response = client.delete("/articles/999999", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 404
+
 def test_read_articles_with_author_id_filter():
     """Тест для получения статей по id автора"""
 
@@ -165,4 +353,754 @@ def test_read_articles_with_pagination():
     response = client.get("/articles?page=2&per_page=5")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
-    assert len(response.json()) <= 5
\ No newline at end of file
+    assert len(response.json()) <= 5
+
+def test_read_articles_with_total():
+    """Тест для получения числа статей: точного по счетчикам и оценки при фильтре по дате"""
+
+    async def count(author_id=None):
+        async with DatabaseManager(test_mode=True).async_session_maker() as session:
+            query = select(func.count()).select_from(Article)
+            if author_id is not None:
+                query = query.where(Article.author_id == author_id)
+            return await session.scalar(query)
+
+    response = client.get("/articles/?per_page=1&with_total=true")
+    assert response.headers["X-Total-Count"] == str(asyncio.run(count()))
+    assert response.headers["X-Total-Count-Exact"] == "true"
+    response = client.get("/articles/?per_page=1&author_id=1&with_total=true")
+    assert response.headers["X-Total-Count"] == str(asyncio.run(count(1)))
+    response = client.get("/articles/?per_page=1&page=1000000&date_form=2022-01-01&with_total=true")
+    assert response.headers["X-Total-Count-Exact"] == "false"
+    assert "X-Total-Count" not in client.get("/articles/?per_page=1").headers
+
+def test_article_counts_follow_writes(access_token):
+    """Тест для проверки, что общий счетчик и счетчики по авторам совпадают с таблицей после записи"""
+
+    db_manager = DatabaseManager(test_mode=True)
+
+    async def counts():
+        async with db_manager.async_session_maker() as session:
+            counters = dict((await session.execute(select(ArticleCount.author_id, ArticleCount.articles))).all())
+            author_id = func.coalesce(Article.author_id, 0)
+            actual = dict((await session.execute(select(author_id, func.count()).group_by(author_id))).all())
+        total = sum(counters.pop(slot) for slot in list(counters) if slot < 0)
+        return {"total": total, **counters}, {"total": sum(actual.values()), **actual}
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    article = {"title": "Count", "content": "Count", "author_id": 2, "published_date": "2022-01-01"}
+    created = client.post("/articles/bulk", json=[article, article], headers=headers).json()
+    counters, actual = asyncio.run(counts())
+    assert counters == actual
+    client.request("DELETE", "/articles/bulk", json=[result["id"] for result in created],
+                   headers=headers)
+    counters, actual = asyncio.run(counts())
+    assert counters == actual
+
+    # Строка автора, у которого не осталось статей, удаляется
+    async def add_and_delete():
+        created = await db_manager.add_articles([write_behind_article("Count", author_id=3)])
+        await db_manager.delete_articles([result["id"] for result in created], 3, True)
+
+    asyncio.run(add_and_delete())
+    counters, actual = asyncio.run(counts())
+    assert counters == actual
+    assert asyncio.run(db_manager.count_articles.__wrapped__(db_manager)) == {
+        "total": actual["total"], "exact": True}
+
+def test_export_articles_ndjson():
+    """Тест для потоковой выгрузки статей в NDJSON"""
+
+    response = client.get("/articles/export?author_id=1")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    articles = [json.loads(line) for line in response.text.splitlines()]
+    assert articles
+    assert all(article["author_id"] == 1 for article in articles)
+
+def test_export_articles_csv():
+    """Тест для потоковой выгрузки статей в CSV"""
+
+    response = client.get("/articles/export?format=csv")
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0] == "id,title,content,published_date,author_id"
+    assert len(lines) > 1
+
+def test_read_articles_summary_view():
+    """Тест для списка статей без текста (view=summary) и с отрывком (view=excerpt)"""
+
+    full = client.get("/articles/", params={"per_page": 5})
+    summary = client.get("/articles/", params={"per_page": 5, "view": "summary"})
+    excerpt = client.get("/articles/", params={"per_page": 5, "view": "excerpt"})
+    assert summary.status_code == 200 and excerpt.status_code == 200
+    assert all("content" not in article for article in summary.json())
+    assert [article["id"] for article in summary.json()] == [article["id"] for article in full.json()]
+    assert [article["excerpt"] for article in excerpt.json()] == [article["content"][:200] for article in full.json()]
+    assert summary.headers["ETag"] != full.headers["ETag"]
+
+def test_read_articles_views_with_null_content():
+    """Тест для списка и выгрузки статьи без текста (content NULL) в каждом представлении"""
+
+    db_manager = DatabaseManager(test_mode=True)
+
+    async def add_article():
+        async with db_manager.async_session_maker() as session:
+            article = Article(title="No content", content=None, author_id=3, published_date=date(1999, 1, 2))
+            session.add(article)
+            await session.commit()
+            return article.id
+
+    article_id = asyncio.run(add_article())
+    forget_cached_reads()
+    params = {"author_id": 3, "date_form": "1999-01-02"}
+    try:
+        for view, field in (("full", "content"), ("summary", None), ("excerpt", "excerpt")):
+            response = client.get("/articles/", params={**params, "view": view})
+            assert response.status_code == 200
+            assert [article["id"] for article in response.json()] == [article_id]
+            if field:
+                assert response.json()[0][field] is None
+            response = client.get("/articles/export", params={**params, "view": view, "format": "csv"})
+            assert response.status_code == 200 and len(response.text.splitlines()) == 2
+    finally:
+        asyncio.run(db_manager.delete_articles([article_id], 3, True))
+
+def test_export_articles_csv_summary_view():
+    """Тест для выгрузки статей в CSV без текста статьи"""
+
+    response = client.get("/articles/export", params={"format": "csv", "view": "summary"})
+    assert response.status_code == 200
+    assert response.text.splitlines()[0] == "id,title,published_date,author_id"
+
+def test_read_articles_with_cursor():
+    """Тест для получения статей постранично по курсору"""
+
+    first_page = client.get("/articles?per_page=1")
+    assert first_page.status_code == 200
+    assert "X-Next-Cursor" in first_page.headers
+
+    second_page = client.get(f"/articles?per_page=1&cursor={first_page.headers['X-Next-Cursor']}")
+    assert second_page.status_code == 200
+    assert second_page.json()[0]["id"] > first_page.json()[0]["id"]
+
+def test_read_articles_with_invalid_cursor():
+    """Тест для получения статей с испорченным курсором"""
+
+    response = client.get("/articles?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_search_articles():
+    """Тест для полнотекстового поиска с постраничным курсором"""
+
+    response = client.get("/articles/search", params={"q": "articles", "per_page": 2})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 2
+    assert all("rank" in article for article in first_page)
+    assert first_page[0]["rank"] >= first_page[1]["rank"]
+
+    response = client.get("/articles/search", params={"q": "articles", "per_page": 2,
+                                                      "cursor": response.headers["X-Next-Cursor"]})
+    assert response.status_code == 200
+    assert not {article["id"] for article in first_page} & {article["id"] for article in response.json()}
+
+def test_search_articles_with_invalid_cursor():
+    """Тест для поиска с некорректным курсором"""
+
+    response = client.get("/articles/search", params={"q": "articles", "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_principal_cache_expires_with_token():
+    """Тест для проверки, что кэш пользователя не переживает срок действия токена"""
+
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    user = {"id": 1, "name": "user1", "role": "admin", "is_active": True}
+    asyncio.run(cache.set("expired", user, exp=time.time() - 1))
+    asyncio.run(cache.set("valid", user, exp=time.time() + 30))
+    assert asyncio.run(cache.get("expired")) is None
+    assert asyncio.run(cache.get("valid")) == user
+
+    cache.invalidate_user("user1")
+    assert asyncio.run(cache.get("valid")) is None
+
+def test_principal_cache_is_bounded():
+    """Тест для проверки вытеснения старых записей из кэша пользователей"""
+
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    for i in range(3):
+        asyncio.run(cache.set(str(i), {"id": i, "name": f"user{i}"}))
+    assert asyncio.run(cache.get("0")) is None
+    assert asyncio.run(cache.get("2"))["id"] == 2
+
+@pytest.mark.skipif(not REDIS_HOST, reason="нужен Redis")
+def test_principal_cache_invalidation_reaches_other_processes():
+    """Тест для проверки, что сброс пользователя в одном процессе удаляет его запись в другом (без уровня в Redis)"""
+
+    def worker_cache():
+        return PrincipalCache(maxsize=10, ttl=60, channel="test-principal:invalidate",
+                              broadcast=Cache(Cache.REDIS, endpoint=REDIS_HOST, port=REDIS_PORT))
+
+    first, second = worker_cache(), worker_cache()
+    user = {"id": 2, "name": "user2", "role": "user", "is_active": True}
+
+    async def scenario():
+        second.channel.start()
+        await asyncio.sleep(0.1)
+        try:
+            await second.set("token", user)
+            cached = await second.get("token")
+            first.invalidate_user("user2")
+            for _ in range(50):
+                if second.channel.stats['received']:
+                    break
+                await asyncio.sleep(0.01)
+            return cached, await second.get("token")
+        finally:
+            await second.channel.stop()
+
+    assert asyncio.run(scenario()) == (user, None)
+    assert first.redis is None and first.channel.stats['published'] == 1
+
+def test_principal_cache_follows_core_and_sql_updates():
+    """Тест для проверки, что смена роли или активности мимо ORM (UPDATE через Core и SQL) сбрасывает кэш"""
+
+    engine = get_database(test_mode=True).engine
+    listener = listen_for_user_changes(engine.url)
+    user = {"id": 3, "name": "user3", "role": "user", "is_active": True}
+
+    async def evicted(change) -> bool:
+        await principal_cache.set("core-token", user)
+        async with engine.begin() as conn:
+            await conn.execute(change)
+        for _ in range(100):
+            if await principal_cache.get("core-token") is None:
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+    async def scenario():
+        listener.start()
+        try:
+            for _ in range(100):
+                if listener.connected:
+                    break
+                await asyncio.sleep(0.01)
+            return [
+                await evicted(update(User).where(User.name == "user3").values(role="admin")),
+                await evicted(update(User).where(User.name == "user3").values(role="user")),
+                await evicted(text("UPDATE users SET is_active = false WHERE name = 'user3'")),
+                await evicted(text("UPDATE users SET is_active = true WHERE name = 'user3'")),
+            ]
+        finally:
+            await listener.stop()
+
+    assert asyncio.run(scenario()) == [True] * 4
+
+def test_login_releases_connection_before_bcrypt(monkeypatch):
+    """Тест для проверки, что вход возвращает соединение в пул до проверки пароля"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    db_manager.session = db_manager.async_session_maker()
+    during_verify = []
+
+    async def verify(plain_password, hashed_password):
+        during_verify.append(db_manager.session)
+        return True
+
+    monkeypatch.setattr("auth.auth.verify_password", verify)
+    user = asyncio.run(authenticate_user(TEST_USERNAME, "ignored", db_manager))
+    assert user["name"] == TEST_USERNAME
+    assert during_verify == [None]
+
+def test_password_hasher_rejects_over_queue_limit():
+    """Тест для проверки отказа при переполнении очереди проверки паролей"""
+
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    hashed = hasher.hash_many(["password"])[0]
+
+    async def verify_twice():
+        return await asyncio.gather(hasher.verify("password", hashed), hasher.verify("password", hashed),
+                                    return_exceptions=True)
+
+    first, second = asyncio.run(verify_twice())
+    assert first is True
+    assert isinstance(second, PasswordHasherBusy)
+
+def test_password_hasher_does_not_import_metrics():
+    """Тест для проверки, что auth.passwords и миграции не тянут prometheus_client (его нет в образе alembic)"""
+
+    code = ("import sys, auth.passwords; from alembic.config import Config; "
+            "from alembic.script import ScriptDirectory; "
+            "list(ScriptDirectory.from_config(Config('alembic.ini')).walk_revisions()); "
+            "assert 'prometheus_client' not in sys.modules, 'prometheus_client imported'")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def test_tagged_cache_invalidation():
+    """Тест для проверки инвалидации кэша статей по тегам"""
+
+    cache = TaggedCache(ttl=60, local_ttl=60, local_size=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        first = await cache.get_or_load("get_articles", "page:1", ["author:1"], loader)
+        cached = await cache.get_or_load("get_articles", "page:1", ["author:1"], loader)
+        await cache.invalidate(["author:2"])
+        still_cached = await cache.get_or_load("get_articles", "page:1", ["author:1"], loader)
+        await cache.invalidate(["author:1"])
+        reloaded = await cache.get_or_load("get_articles", "page:1", ["author:1"], loader)
+        return first, cached, still_cached, reloaded
+
+    assert asyncio.run(scenario()) == (1, 1, 1, 2)
+    assert cache.snapshot()["get_articles"] == {"misses": 2, "hits_local": 2}
+
+def test_tagged_cache_coalesces_concurrent_misses():
+    """Тест для проверки, что одновременные промахи дают одну загрузку"""
+
+    cache = TaggedCache(ttl=60, local_ttl=60, local_size=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("get_articles", "page:1", ["all"], loader)
+                                      for _ in range(20)))
+
+    assert asyncio.run(scenario()) == ["value"] * 20
+    assert len(calls) == 1
+    assert cache.snapshot()["get_articles"] == {"misses": 1, "coalesced": 19}
+
+def test_tagged_cache_serves_stale_value():
+    """Тест для проверки выдачи устаревшего значения во время обновления и при ошибке базы"""
+
+    cache = TaggedCache(ttl=60, local_ttl=0, local_size=10, stale_ttl=60)
+    results = iter(["old", "new"])
+
+    async def loader():
+        return next(results)
+
+    async def failing_loader():
+        raise ConnectionError("database is down")
+
+    async def scenario():
+        first = await cache.get_or_load("get_articles", "page:1", ["all"], loader)
+        stale = await cache.get_or_load("get_articles", "page:1", ["all"], loader)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        refreshed = await cache.get_or_load("get_articles", "page:1", ["all"], failing_loader)
+        await asyncio.sleep(0)
+        after_error = await cache.get_or_load("get_articles", "page:1", ["all"], failing_loader)
+        return first, stale, refreshed, after_error
+
+    assert asyncio.run(scenario()) == ("old", "old", "new", "new")
+    assert cache.snapshot()["get_articles"]["stale_errors"] >= 1
+
+@pytest.mark.skipif(not ARTICLE_CACHE_REDIS, reason="нужен Redis")
+def test_tagged_cache_invalidation_reaches_other_processes():
+    """Тест для проверки, что инвалидация в одном процессе сразу сбрасывает L1 другого через канал Redis"""
+
+    def worker_cache():
+        redis = Cache(Cache.REDIS, endpoint=REDIS_HOST, port=REDIS_PORT, namespace="test-broadcast",
+                      serializer=OrjsonSerializer())
+        return TaggedCache(ttl=60, local_ttl=60, local_size=10, redis=redis, channel="test-broadcast:invalidate")
+
+    first, second = worker_cache(), worker_cache()
+    namespace = f"broadcast:{time.time()}"
+    values = iter(["old", "new"])
+
+    async def loader():
+        return next(values)
+
+    async def scenario():
+        second.channel.start()
+        await asyncio.sleep(0.1)
+        try:
+            cached = await second.get_or_load("get_articles", "page:1", ["author:1"], loader, namespace)
+            await first.invalidate(["author:1"], namespace)
+            for _ in range(50):
+                if second.channel.stats['received']:
+                    break
+                await asyncio.sleep(0.01)
+            return cached, await second.get_or_load("get_articles", "page:1", ["author:1"], loader, namespace)
+        finally:
+            await second.channel.stop()
+
+    assert asyncio.run(scenario()) == ("old", "new")
+    assert second.snapshot()["get_articles"] == {"misses": 2}
+
+@pytest.mark.parametrize("budget, workers, expected", [
+    (0, 4, (20, 10)),
+    (120, 4, (20, 10)),
+    (80, 4, (13, 7)),
+    (10, 4, (1, 1)),
+    (3, 4, (1, 0)),
+])
+def test_pool_limits_split_connection_budget(budget, workers, expected):
+    """Тест для проверки деления бюджета соединений между процессами"""
+
+    assert pool_limits(20, 10, budget, workers) == expected
+    if budget:
+        # Соединение LISTEN процесса вычитается из его доли
+        assert sum(pool_limits(20, 10, budget, workers, reserved=1)) == max(1, budget // workers - 1)
+
+def test_concurrent_article_reads_issue_one_query():
+    """Тест для проверки, что одновременные промахи кэша выполняют один запрос к базе"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def scenario():
+        await article_cache.invalidate(["all"], db_manager.cache_namespace)
+        event.listen(db_manager.engine.sync_engine, "before_cursor_execute", count_statement)
+        try:
+            return await asyncio.gather(*(db_manager.get_articles(1, 7, None, None) for _ in range(10)))
+        finally:
+            event.remove(db_manager.engine.sync_engine, "before_cursor_execute", count_statement)
+
+    pages = asyncio.run(scenario())
+    assert all(page == pages[0] for page in pages)
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]) == 1
+
+def test_fast_json_response_matches_response_model():
+    """Тест для проверки, что быстрый путь сериализации отдает те же поля, что и Article_api"""
+
+    response = client.get("/articles/1")
+    article = {**response.json(), "version": 1, "updated_at": None}
+    headers = Response(headers={"ETag": '"1-1"'})
+    fast_response = fast_json_response([article], headers)
+    assert json.loads(fast_response.body) == [response.json()]
+    assert fast_response.headers["ETag"] == '"1-1"'
+
+@pytest.mark.parametrize("url", [
+    "/articles/1",
+    "/articles/?per_page=5",
+    "/articles/?per_page=5&view=summary",
+    "/articles/?per_page=5&view=excerpt&with_total=true",
+    "/articles/search?q=article&per_page=5",
+])
+def test_fast_json_route_matches_default(url, monkeypatch):
+    """Тест для проверки, что маршрут с FAST_JSON_RESPONSES отдает тот же ответ, что и без него"""
+
+    default = client.get(url)
+    monkeypatch.setattr("articles.router.FAST_JSON_RESPONSES", True)
+    fast = client.get(url)
+    assert fast.status_code == default.status_code == 200
+    assert fast.content == default.content
+    for header in ("content-type", "content-length", "etag", "x-next-cursor", "x-total-count",
+                   "x-total-count-exact"):
+        assert fast.headers.get(header) == default.headers.get(header), header
+
+def test_metrics_endpoint():
+    """Тест для проверки метрик по шаблону маршрута, запросам к базе и кэшу"""
+
+    article_cache.clear()
+    client.get("/articles/1")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/articles/{article_id}",status="200"}' in body
+    assert 'http_request_db_queries_count{method="GET",route="/articles/{article_id}"}' in body
+    assert 'db_query_duration_seconds_count{database="test_' in body
+    assert any(line.startswith('cache_events_total{cache="articles"') and 'function="get_article_by_id"' in line
+               for line in body.splitlines())
+
+def test_query_budget_detects_repeated_statements():
+    """Тест для проверки, что одинаковые запросы внутри бюджета считаются N+1"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    with pytest.raises(AssertionError, match="N\\+1"):
+        with query_budget(statements=10):
+            for article_id in (1, 2, 3):
+                asyncio.run(db_manager.get_user_id_by_article_id(article_id))
+
+@pytest.mark.parametrize("method, url, body, statements, round_trips", [
+    ("GET", "/articles/1", None, 1, 3),
+    ("GET", "/articles/?page=1&per_page=10", None, 1, 3),
+    ("GET", "/articles/?page=1&per_page=10&with_total=true", None, 2, 6),
+    ("PUT", "/articles/2", {"title": "Budget", "content": "Budget", "author_id": 1, "published_date": "2022-01-01"}, 2, 6),
+    ("POST", "/auth/token", {"username": TEST_USERNAME, "password": TEST_PASSWORD}, 1, 3),
+])
+def test_hot_path_query_budget(method, url, body, statements, round_trips, access_token):
+    """Тест для проверки бюджета запросов к базе на горячих путях при пустых кэшах"""
+
+    forget_cached_reads()
+    with query_budget(statements, round_trips):
+        response = client.request(method, url, json=body, headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 200
+
+def test_compression_negotiation():
+    """Тест для выбора алгоритма сжатия по Accept-Encoding"""
+
+    codecs = available_codecs(["br", "gzip"])
+    assert negotiate("gzip, deflate", codecs) == "gzip"
+    assert negotiate("gzip;q=0, identity", codecs) is None
+    assert negotiate("*", codecs) == next(iter(codecs))
+    assert negotiate("", codecs) is None
+
+def test_compressed_response_is_cached():
+    """Тест для сжатия ответа и повторного использования сжатых байтов помеченного ответа"""
+
+    test_app = FastAPI()
+    test_app.add_middleware(CompressionMiddleware, encodings=["gzip"], minimum_size=100)
+
+    @test_app.get("/page")
+    async def page(request: Request):
+        precompress(request)
+        return [{"id": i, "title": "Article"} for i in range(50)]
+
+    @test_app.get("/small")
+    async def small():
+        return {"id": 1}
+
+    test_client = TestClient(test_app)
+    before = compressed_bodies.stats['hits_local']
+    first = test_client.get("/page", headers={"Accept-Encoding": "gzip"})
+    second = test_client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in first.headers["Vary"]
+    assert first.json() == second.json() and len(first.json()) == 50
+    assert compressed_bodies.stats['hits_local'] == before + 1
+    assert "Content-Encoding" not in test_client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+
+def test_compressed_response_has_weak_etag():
+    """Тест для проверки, что сжатый и несжатый ответы не делят строгий ETag, а условный запрос работает для обоих"""
+
+    test_app = FastAPI()
+    test_app.add_middleware(CompressionMiddleware, encodings=["gzip"], minimum_size=100)
+
+    @test_app.get("/page")
+    async def page(request: Request, response: Response):
+        etag = '"page-1"'
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        set_validators(response, etag)
+        return [{"id": i, "title": "Article"} for i in range(50)]
+
+    test_client = TestClient(test_app)
+    compressed = test_client.get("/page", headers={"Accept-Encoding": "gzip"})
+    identity = test_client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert (compressed.headers["ETag"], identity.headers["ETag"]) == ('W/"page-1"', '"page-1"')
+
+    for headers, etag in ((compressed.headers, 'W/"page-1"'), (identity.headers, '"page-1"')):
+        response = test_client.get("/page", headers={"Accept-Encoding": "gzip", "If-None-Match": headers["ETag"]})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+def test_export_articles_compressed():
+    """Тест для потокового сжатия выгрузки статей"""
+
+    with client.stream("GET", "/articles/export", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["Content-Encoding"] == "gzip"
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert lines and "id" in lines[0]
+
+def test_reads_are_routed_to_replica():
+    """Тест для проверки, что чтение идет на реплику, а после записи - в основную базу"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    replica = create_replica(f"{DB_HOST}:{DB_PORT}/test_{DB_NAME}", DB_NAME, test_mode=True)
+    db_manager.replicas = ReplicaSet([replica])
+    asyncio.run(db_manager.replicas.check())
+    assert replica.healthy and replica.lag == 0
+
+    with QueryRecorder(replica.engine) as on_replica, query_budget(statements=0):
+        assert asyncio.run(db_manager.get_user_id_by_article_id(1)) is not None
+    assert len(on_replica.statements) == 1
+
+    writes = []
+    db_manager.on_write = lambda: writes.append(True)
+    db_manager._pin_primary()
+    assert writes and db_manager.read_primary
+    with QueryRecorder(replica.engine) as on_replica, query_budget(statements=1):
+        asyncio.run(db_manager.get_user_id_by_article_id(1))
+    assert not on_replica.statements
+    asyncio.run(replica.engine.dispose())
+
+def test_users_are_read_from_primary():
+    """Тест для проверки, что пользователь (роль для кэша) читается из основной базы, а не с реплики"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    replica = create_replica(f"{DB_HOST}:{DB_PORT}/test_{DB_NAME}", DB_NAME, test_mode=True)
+    db_manager.replicas = ReplicaSet([replica])
+    with QueryRecorder(replica.engine) as on_replica:
+        assert asyncio.run(db_manager.get_user_by_username("user1")) is not None
+    assert not on_replica.statements
+    asyncio.run(replica.engine.dispose())
+
+def test_unavailable_replica_falls_back_to_primary():
+    """Тест для проверки, что при недоступной реплике чтение идет в основную базу"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    replica = create_replica(f"{DB_HOST}:5999", f"test_{DB_NAME}", test_mode=True)
+    db_manager.replicas = ReplicaSet([replica])
+    with query_budget(statements=1):
+        assert asyncio.run(db_manager.get_user_id_by_article_id(1)) is not None
+    assert not replica.healthy
+    assert db_manager.replicas.choose() is None
+    asyncio.run(replica.engine.dispose())
+
+def test_export_falls_back_to_primary():
+    """Тест для проверки, что выгрузка с недоступной реплики идет из основной базы"""
+
+    async def export(db_manager):
+        return [article async for rows in db_manager.stream_articles(chunk_size=2) for article in rows]
+
+    db_manager = DatabaseManager(test_mode=True)
+    replica = create_replica(f"{DB_HOST}:5999", f"test_{DB_NAME}", test_mode=True)
+    db_manager.replicas = ReplicaSet([replica])
+    articles = asyncio.run(export(db_manager))
+    assert articles and not replica.healthy and replica.active == 0
+    assert [article["id"] for article in articles] == sorted(article["id"] for article in articles)
+    asyncio.run(replica.engine.dispose())
+
+def test_primary_cookie_is_capped():
+    """Тест для проверки, что cookie закрепления за основной базой не действует дольше окна"""
+
+    def request(cookie):
+        return Request({"type": "http", "headers": [(b"cookie", f"{PRIMARY_COOKIE}={cookie}".encode())]})
+
+    assert primary_until(request(time.time() + 5)) > time.time()
+    assert primary_until(request(time.time() + 10 ** 6)) < time.time() + 60
+    assert primary_until(request("invalid")) == 0
+
+def test_warmup_primes_statements_and_preloads_pages():
+    """Тест для проверки прогрева: запросы компилируются заранее, первые страницы попадают в кэш"""
+
+    engine = get_database(test_mode=True).engine.sync_engine
+    engine._compiled_cache.clear()
+    article_cache.clear()
+    warmup = Warmup(test_mode=True, enabled=True, preload_pages=2)
+    assert not warmup.ready
+    asyncio.run(warmup.run())
+    assert warmup.ready
+    assert {"connections", "preload", "total"} <= set(warmup.timings)
+    assert len(engine._compiled_cache) > 0
+
+    db_manager = DatabaseManager(test_mode=True)
+    with query_budget(statements=0):
+        asyncio.run(db_manager.get_articles(2, 10))
+
+def test_ready_waits_for_warmup():
+    """Тест для проверки, что /ready отвечает 503 до прогрева, а /health - сразу"""
+
+    assert client.get("/health").status_code == 200
+    assert client.get("/ready").status_code == 503
+    with TestClient(app) as started:
+        deadline = time.monotonic() + 10
+        while started.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        response = started.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["timings"]["total"] > 0
+
+def write_behind_article(title, author_id=2):
+    return {"title": title, "content": "Write-behind", "author_id": author_id, "published_date": None}
+
+def test_write_behind_inserts_batch_in_one_statement():
+    """Тест для проверки, что статьи из очереди записываются одним INSERT и получают свои id"""
+
+    db_manager = DatabaseManager(test_mode=True)
+
+    async def scenario():
+        created = await asyncio.gather(*(db_manager.enqueue_article(write_behind_article(f"Batch {i}"))
+                                         for i in range(20)))
+        await db_manager.batcher.stop()
+        return created
+
+    with query_budget(statements=1):
+        created = asyncio.run(scenario())
+    assert [article["title"] for article in created] == [f"Batch {i}" for i in range(20)]
+    assert len({article["id"] for article in created}) == 20
+    asyncio.run(db_manager.delete_articles([article["id"] for article in created], 2, True))
+
+def test_create_article_write_behind(access_token, monkeypatch):
+    """Тест для создания статьи через очередь отложенной записи"""
+
+    monkeypatch.setattr("articles.router.ARTICLES_WRITE_BEHIND", True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    with TestClient(app) as started:
+        response = started.post("/articles/", json=write_behind_article("Queued"), headers=headers)
+        assert response.status_code == 200
+        article_id = response.json()["id"]
+        assert started.get(f"/articles/{article_id}").json()["title"] == "Queued"
+        assert started.delete(f"/articles/{article_id}", headers=headers).status_code == 200
+
+def test_write_behind_isolates_failed_article():
+    """Тест для проверки, что ошибочная статья не отменяет запись остальных статей пачки"""
+
+    db_manager = DatabaseManager(test_mode=True)
+
+    async def scenario():
+        articles = [write_behind_article("Valid 1"), write_behind_article("Orphan", author_id=999999),
+                    write_behind_article("Valid 2")]
+        results = await asyncio.gather(*(db_manager.enqueue_article(article) for article in articles),
+                                       return_exceptions=True)
+        await db_manager.batcher.stop()
+        return results
+
+    first, orphan, second = asyncio.run(scenario())
+    assert isinstance(orphan, Exception)
+    assert (first["title"], second["title"]) == ("Valid 1", "Valid 2")
+    asyncio.run(db_manager.delete_articles([first["id"], second["id"]], 2, True))
+
+def test_write_behind_is_not_routed_to_replica():
+    """Тест для проверки, что ошибка записи пачки не помечает реплику и не ставит статью в очередь повторно"""
+
+    db_manager = DatabaseManager(test_mode=True)
+    replica = create_replica(f"{DB_HOST}:{DB_PORT}/test_{DB_NAME}", DB_NAME, test_mode=True)
+    db_manager.replicas = ReplicaSet([replica])
+    flushed = []
+
+    async def flush(articles):
+        flushed.extend(articles)
+        raise ConnectionError("database is down")
+
+    db_manager.batcher = ArticleBatcher(flush, batch_size=10, max_wait=0, queue_size=10, put_timeout=0.05)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await db_manager.enqueue_article(write_behind_article("Once"))
+        await db_manager.batcher.stop()
+
+    asyncio.run(scenario())
+    assert [article["title"] for article in flushed] == ["Once"]
+    assert replica.healthy
+    assert not hasattr(DatabaseManager.enqueue_article, "__wrapped__")
+    assert hasattr(DatabaseManager.get_users_dict, "__wrapped__")
+    asyncio.run(replica.engine.dispose())
+
+def test_write_behind_applies_backpressure():
+    """Тест для проверки, что при заполненной очереди запись отклоняется, а остановка дописывает очередь"""
+
+    async def scenario():
+        release = asyncio.Event()
+        written = []
+
+        async def flush(articles):
+            await release.wait()
+            written.extend(articles)
+            return articles
+
+        batcher = ArticleBatcher(flush, batch_size=1, max_wait=0, queue_size=1, put_timeout=0.05)
+        pending = [asyncio.ensure_future(batcher.submit({"title": str(i)})) for i in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(WriteQueueFull):
+            await batcher.submit({"title": "rejected"})
+        release.set()
+        await batcher.stop()
+        return await asyncio.gather(*pending), written
+
+    results, written = asyncio.run(scenario())
+    assert results == [{"title": "0"}, {"title": "1"}]
+    assert written == results
@@ -0,0 +1,134 @@
+"""Проверка планов запросов DatabaseManager: горячие запросы не должны сканировать таблицы целиком.
+
+Тестовая база заполняется достаточным числом строк, чтобы планировщик
+выбирал индексы так же, как на боевых объемах.
+"""
+import asyncio
+import json
+from datetime import date
+import pytest
+from sqlalchemy import event, text
+from db.db import DatabaseManager
+from db.db_models import Article, User
+
+PLAN_PREFIX = 'plan_'
+USERS = 20000
+ARTICLES = 100000
+
+db_manager = DatabaseManager(test_mode=True)
+
+
+async def seed():
+    async with db_manager.engine.begin() as conn:
+        await conn.execute(
+            text(f"INSERT INTO {User.__tablename__} (email, name, hashed_password, is_active, role) "
+                 "SELECT :prefix || g || '@example.com', :prefix || g, 'x', true, 'user' "
+                 "FROM generate_series(1, :users) AS g"),
+            {"prefix": PLAN_PREFIX, "users": USERS},
+        )
+        await conn.execute(
+            text(f"INSERT INTO {Article.__tablename__} (title, content, published_date, author_id) "
+                 f"SELECT :prefix || g, 'content', DATE '2020-01-01' + (g % 1500), u.id "
+                 f"FROM generate_series(1, :articles) AS g "
+                 f"JOIN {User.__tablename__} u ON u.name = :prefix || (g % :users + 1)"),
+            {"prefix": PLAN_PREFIX, "articles": ARTICLES, "users": USERS},
+        )
+        await conn.execute(text(f"ANALYZE {User.__tablename__}"))
+        await conn.execute(text(f"ANALYZE {Article.__tablename__}"))
+
+
+async def cleanup():
+    async with db_manager.engine.begin() as conn:
+        await conn.execute(text(f"DELETE FROM {Article.__tablename__} WHERE title LIKE :pattern"),
+                           {"pattern": PLAN_PREFIX + '%'})
+        await conn.execute(text(f"DELETE FROM {User.__tablename__} WHERE name LIKE :pattern"),
+                           {"pattern": PLAN_PREFIX + '%'})
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded_database():
+    """Функция для заполнения тестовой базы на время проверки планов"""
+    asyncio.run(cleanup())
+    asyncio.run(seed())
+    yield
+    asyncio.run(cleanup())
+
+
+def seq_scans(plan: dict) -> list:
+    """Таблицы, которые план читает последовательным сканированием"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def explain_calls(call) -> list:
+    """Выполнение запроса с записью SQL и EXPLAIN каждого SELECT"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db_manager.engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await call()
+    finally:
+        event.remove(db_manager.engine.sync_engine, "before_cursor_execute", capture)
+
+    plans = []
+    async with db_manager.engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement.lstrip().upper().startswith("SELECT"):
+                result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plans.append((statement, result.scalar()[0]["Plan"]))
+    return plans
+
+
+# Кэшируемые методы проверяются без кэша, иначе запрос в базу может не выполниться
+get_articles = DatabaseManager.get_articles.__wrapped__
+get_article_by_id = DatabaseManager.get_article_by_id.__wrapped__
+search_articles = DatabaseManager.search_articles.__wrapped__
+count_articles = DatabaseManager.count_articles.__wrapped__
+
+HOT_QUERIES = {
+    "get_articles": lambda: get_articles(db_manager, 1, 10),
+    "get_articles_deep_cursor": lambda: get_articles(db_manager, 1, 10, None, None, 50000),
+    "get_articles_by_author": lambda: get_articles(db_manager, 1, 10, 42),
+    "get_articles_by_author_cursor": lambda: get_articles(db_manager, 1, 10, 42, None, 50000),
+    "get_articles_by_date": lambda: get_articles(db_manager, 1, 10, None, date(2021, 6, 1)),
+    "get_articles_by_author_and_date": lambda: get_articles(db_manager, 1, 10, 42, date(2021, 6, 1)),
+    "get_article_by_id": lambda: get_article_by_id(db_manager, 500),
+    "get_user_id_by_article_id": lambda: db_manager.get_user_id_by_article_id(500),
+    "get_user_by_username": lambda: db_manager.get_user_by_username(f"{PLAN_PREFIX}100"),
+    "search_articles": lambda: search_articles(db_manager, "1234", 10),
+    "count_articles": lambda: count_articles(db_manager),
+    "count_articles_by_author": lambda: count_articles(db_manager, 42),
+}
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(name):
+    """Тест для проверки, что горячий запрос не переходит на последовательное сканирование"""
+
+    plans = asyncio.run(explain_calls(HOT_QUERIES[name]))
+    assert plans, f"{name} did not query the database"
+    for statement, plan in plans:
+        assert seq_scans(plan) == [], f"{name} uses a sequential scan:\n{statement}\n{json.dumps(plan, indent=2)}"
+
+
+def test_article_count_estimate():
+    """Тест для проверки, что оценка числа статей за дату близка к точному числу"""
+
+    async def counts():
+        estimate = await count_articles(db_manager, None, date(2021, 6, 1))
+        async with db_manager.engine.connect() as conn:
+            exact = await conn.scalar(text(f"SELECT count(*) FROM {Article.__tablename__} "
+                                           "WHERE published_date = DATE '2021-06-01'"))
+        return estimate, exact
+
+    estimate, exact = asyncio.run(counts())
+    assert estimate["exact"] is False
+    assert exact / 2 <= estimate["total"] <= exact * 2
+